@@ -19,6 +19,24 @@ API_SETTINGS = {
     
     # Exponential backoff base (in seconds)
     "BACKOFF_BASE": 2,
+    
+    # Upper bound on a single backoff delay (in seconds)
+    "BACKOFF_CAP": 32,
+    
+    # Number of requests per Gmail batch HTTP call (Gmail caps batches at 100)
+    "BATCH_CHUNK_SIZE": 50,
+    
+    # Maximum number of batch HTTP calls in flight at once
+    "MAX_BATCH_WORKERS": 5,
+    
+    # Message IDs per messages.batchModify / batchDelete call (Gmail caps it at 1000)
+    "MAX_IDS_PER_REQUEST": 1000,
+    
+    # Worker threads fetching message batches concurrently
+    "MAX_FETCH_WORKERS": 4,
+    
+    # Gmail per-user quota units available per second
+    "QUOTA_UNITS_PER_SECOND": 250,
 }
 
 # Cache Settings
@@ -58,6 +76,20 @@ EMAIL_SETTINGS = {
     
     # Maximum tokens for AI summarization
     "AI_SUMMARY_MAX_TOKENS": 150,
+    
+    # Maximum input tokens sent for AI summarization
+    "AI_SUMMARY_INPUT_TOKENS": 3000,
+    
+    # AI summaries kept in memory, keyed by content hash
+    "SUMMARY_CACHE_SIZE": 1024,
+    
+    # Classify existing emails through the OpenAI Batch API (50% cheaper, results within 24h)
+    "USE_BATCH_LLM": False,
+    
+    # Fetch messages as one raw RFC 822 blob (format=raw) and parse them locally.
+    # Attachments then arrive inline whatever their size or type, so the
+    # ATTACHMENT_SETTINGS size/type limits no longer avoid downloading them.
+    "FETCH_RAW": False,
 }
 
 # Attachment Processing Settings
@@ -87,13 +119,46 @@ LLM_SETTINGS = {
     "CLASSIFICATION_MODEL": "gpt-4o-mini",
     "RESPONSE_MODEL": "gpt-4o-mini",
 
+    # Concurrent LLM calls when generating draft responses
+    "RESPONSE_WORKERS": 10,
+
+    # Uncached emails categorized per LLM request
+    "CLASSIFICATION_BATCH_SIZE": 10,
+
+    # Batched classification requests sent concurrently
+    "CLASSIFICATION_WORKERS": 4,
+
+    # LLM requests allowed per minute across all threads (sliding window),
+    # the provider quota the classification sleeps used to stay under
+    "REQUESTS_PER_MINUTE": 15,
+
+    # Bodies are cut to these many tokens before being sent to the model
+    # (tiktoken encoding; about 4 characters per token without tiktoken)
+    "TOKENIZER_ENCODING": "o200k_base",
+    "CLASSIFICATION_BODY_TOKENS": 800,
+    "RESPONSE_BODY_TOKENS": 3000,
+
+    # Regexes matched against the subject and first 256 characters of the
+    # body; an email matching exactly one category skips the cache and LLM
+    "KEYWORD_RULES": {
+        "Promotions": [r"\b\d{1,2}% off\b", r"\bflash sale\b", r"\bpromo code\b", r"\blimited[- ]time offer\b", r"\bcoupon\b"],
+        "Updates": [r"\border confirmation\b", r"\bhas shipped\b", r"\bout for delivery\b", r"\btracking number\b", r"\bverification code\b"],
+    },
+
+    # Same for the reply check of Important emails: automated notices never
+    # need a reply, a reply or forward that asks a question does
+    "REPLY_KEYWORD_RULES": {
+        "Unwanted Important": [r"\bOTP\b", r"\bverification code\b", r"\bpassword reset\b", r"\bsecurity alert\b", r"\bunsubscribe\b", r"\bno-?reply\b"],
+        "Wanted Important": [r"\A(?:re|fwd?):.*\n[\s\S]*\?"],
+    },
+
     "CATEGORIES": ["Wanted Important", "Unwanted Important", "Promotions", "Updates", "Spam"],
 }
 
 # Classification Cache Settings
 CLASSIFICATION_CACHE_SETTINGS = {
-    # Cache file for storing classified emails
-    "CACHE_FILE": "cache/classification_cache.json",
+    # Append-only JSONL log of classified emails
+    "CACHE_FILE": "cache/classification_cache.jsonl",
     
     # Similarity threshold for cache matching (0.0 to 1.0)
     "SIMILARITY_THRESHOLD": 0.85,
@@ -110,8 +175,41 @@ CLASSIFICATION_CACHE_SETTINGS = {
     # Minimum content length to cache (avoid caching very short emails)
     "MIN_CONTENT_LENGTH": 50,
     
+    # Minimum words left after preprocessing (skip boilerplate-only emails)
+    "MIN_CONTENT_WORDS": 5,
+    
     # Maximum content length to compare (truncate very long emails for similarity)
     "MAX_CONTENT_LENGTH": 2000,
+    
+    # MinHash LSH candidate filter (Jaccard of word 3-shingles, looser than
+    # SIMILARITY_THRESHOLD so cosine still decides the match)
+    "LSH_THRESHOLD": 0.5,
+    "LSH_NUM_PERM": 64,
+}
+
+# Embedding similarity classifier settings (partial_rag)
+RAG_SETTINGS = {
+    # SentenceTransformer model used to embed subject + body
+    "MODEL_NAME": "all-MiniLM-L6-v2",
+    
+    # Int8 quantized ONNX export of the model, run with onnxruntime.
+    # Set to None to embed with the full precision PyTorch model.
+    "ONNX_FILE": "onnx/model_quint8_avx2.onnx",
+    
+    # FAISS index and the id -> label metadata stored next to it
+    "INDEX_PATH": "email_index.faiss",
+    "METADATA_PATH": "metadata.json",
+    
+    # Minimum cosine similarity to reuse a stored label
+    "SIMILARITY_THRESHOLD": 0.75,
+    
+    # Texts embedded per model forward pass
+    "ENCODE_BATCH_SIZE": 64,
+    
+    # HNSW graph used for new indexes (neighbours per node, build and search breadth)
+    "HNSW_M": 32,
+    "HNSW_EF_CONSTRUCTION": 80,
+    "HNSW_EF_SEARCH": 32,
 }
 
 # Gmail Label IDs
@@ -1,13 +1,175 @@
 import base64
-from email.mime.text import MIMEText
+import logging
+import re
+from email.header import Header
+from email.utils import formataddr, parseaddr
 from gmail_utils.auth import get_gmail_service
+from gmail_utils.fetch import list_message_ids
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from googleapiclient.errors import HttpError
 from googleapiclient.http import BatchHttpRequest
+from gmail_utils.retry import RETRYABLE_STATUSES, exponential_backoff, retry_after_seconds, retry_on_api_error
+from gmail_utils.ratelimit import QUOTA_COSTS, get_rate_limiter
+from gmail_utils.monitor import get_quota_monitor
+from config.settings import API_SETTINGS, LLM_SETTINGS
+from llm_utils.classifier import generate_response
+
+BATCH_CHUNK_SIZE = API_SETTINGS["BATCH_CHUNK_SIZE"]
+MAX_BATCH_WORKERS = API_SETTINGS["MAX_BATCH_WORKERS"]
+MAX_IDS_PER_REQUEST = API_SETTINGS["MAX_IDS_PER_REQUEST"]
+RESPONSE_WORKERS = LLM_SETTINGS["RESPONSE_WORKERS"]
+MAX_RETRIES = API_SETTINGS["MAX_RETRIES"]
+BACKOFF_CAP = API_SETTINGS["BACKOFF_CAP"]
+
+logger = logging.getLogger(__name__)
+
+def _execute_batches(items, build_request, call_type, description, on_success=None, chunk_size=BATCH_CHUNK_SIZE):
+    """
+    Execute one request per item as concurrent Gmail batch HTTP calls.
+
+    Items are split into chunks of chunk_size, each sent as a single batch
+    from a worker thread. Every batch takes its quota from the shared token
+    bucket before executing, so concurrent callers stay under the per-second
+    budget together. Batch members that fail with a retryable status are
+    collected and re-sent with exponential backoff instead of being dropped.
+
+    Args:
+        items (list): Items to build requests for (message IDs, drafts, ...)
+        build_request (callable): (service, item) -> HttpRequest
+        call_type (str): QUOTA_COSTS key of each request (e.g. "trash")
+        description (str): Used in error messages (e.g. "moving message")
+        on_success (callable): Optional (item, response) callback
+        chunk_size (int): Requests per batch HTTP call
+    """
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+    with ThreadPoolExecutor(max_workers=min(MAX_BATCH_WORKERS, len(chunks))) as executor:
+        futures = [
+            executor.submit(_execute_with_retry, chunk, build_request, call_type, description, on_success)
+            for chunk in chunks
+        ]
+
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except HttpError as error:
+                logger.error("Batch error %s: %s", description, error)
+
+def _execute_id_chunks(email_ids, build_request, call_type, description, chunk_size=MAX_IDS_PER_REQUEST):
+    """
+    Execute one multi-ID request (batchModify, batchDelete) per chunk of IDs concurrently.
+
+    Each request takes up to chunk_size IDs (Gmail allows at most 1000) and
+    is charged its quota cost once, however many IDs it carries.
+
+    Args:
+        email_ids (list): Message IDs to act on
+        build_request (callable): (service, ids) -> HttpRequest
+        call_type (str): QUOTA_COSTS key of the request (e.g. "batchModify")
+        description (str): Used in error messages (e.g. "moving messages")
+        chunk_size (int): IDs per request
+    """
+    chunk_size = min(chunk_size, MAX_IDS_PER_REQUEST)
+    chunks = [email_ids[i:i + chunk_size] for i in range(0, len(email_ids), chunk_size)]
+    quota_cost = QUOTA_COSTS[call_type]
+    rate_limiter = get_rate_limiter()
+    monitor = get_quota_monitor()
+
+    @retry_on_api_error()
+    def run_chunk(chunk):
+        # get_gmail_service() hands each worker thread its own service
+        service = get_gmail_service()
+        rate_limiter.acquire(quota_cost)
+        try:
+            build_request(service, chunk).execute()
+        except Exception:
+            monitor.record_api_call(call_type, quota_cost, success=False)
+            raise
+        monitor.record_api_call(call_type, quota_cost)
+
+    with ThreadPoolExecutor(max_workers=min(MAX_BATCH_WORKERS, len(chunks))) as executor:
+        futures = [executor.submit(run_chunk, chunk) for chunk in chunks]
+
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except HttpError as error:
+                logger.error("Error %s: %s", description, error)
+
+def _execute_with_retry(items, build_request, call_type, description, on_success=None):
+    """
+    Execute a batch, re-sending members that failed with a retryable status.
+
+    A batch call that fails as a whole is retried by retry_on_api_error
+    with the members still pending, so members that already succeeded are
+    not sent twice.
+
+    Args:
+        items (list): Items in this batch
+        build_request (callable): (service, item) -> HttpRequest
+        call_type (str): QUOTA_COSTS key of each request
+        description (str): Used in error messages
+        on_success (callable): Optional (item, response) callback
+    """
+    pending = list(range(len(items)))
+    quota_cost = QUOTA_COSTS[call_type]
+    rate_limiter = get_rate_limiter()
+    monitor = get_quota_monitor()
+
+    @retry_on_api_error()
+    def send(pending, attempt):
+        """Send the pending members once. Returns (retryable indices, Retry-After delays)."""
+        failed = []
+        retry_after = []
+
+        def callback(request_id, response, exception):
+            index = int(request_id)
+            item = items[index]
+            if exception is None:
+                if on_success:
+                    on_success(item, response)
+            elif (isinstance(exception, HttpError)
+                  and exception.resp.status in RETRYABLE_STATUSES
+                  and attempt < MAX_RETRIES):
+                failed.append(index)
+                delay = retry_after_seconds(exception)
+                if delay is not None:
+                    retry_after.append(delay)
+            else:
+                label = item if isinstance(item, str) else request_id
+                logger.error("Error %s %s: %s", description, label, exception)
+
+        # get_gmail_service() hands each worker thread its own service,
+        # and a fresh one after a 401
+        service = get_gmail_service()
+        batch = service.new_batch_http_request(callback=callback)
+        for index in pending:
+            batch.add(build_request(service, items[index]), request_id=str(index))
+        rate_limiter.acquire(len(pending) * quota_cost)
+        try:
+            batch.execute()
+        except Exception:
+            monitor.record_api_call(call_type, len(pending) * quota_cost, success=False)
+            raise
+        monitor.record_api_call(call_type, len(pending) * quota_cost)
+        return failed, retry_after
+
+    for attempt in range(MAX_RETRIES + 1):
+        failed, retry_after = send(pending, attempt)
+        if not failed:
+            return
+
+        # Honor the server's Retry-After when given, otherwise back off
+        delay = max(retry_after) if retry_after else min(BACKOFF_CAP, exponential_backoff(attempt))
+        logger.warning("Retrying %d failed requests (%s) in %.2fs", len(failed), description, delay)
+        time.sleep(delay)
+        pending = failed
 
 def move_email(email_id, label_name):
     """Move a single email to a label."""
     service = get_gmail_service()
+    get_rate_limiter().acquire(QUOTA_COSTS["modify"])
     service.users().messages().modify(
         userId="me",
         id=email_id,
@@ -15,213 +177,180 @@ def move_email(email_id, label_name):
     ).execute()
 
 def batch_move_emails(email_ids, label_name):
-    """Move multiple emails to a label in a single batch operation."""
+    """Move multiple emails to a label using concurrent batch operations."""
     if not email_ids:
         return
-        
-    service = get_gmail_service()
-    
-    def callback(request_id, response, exception):
-        if exception:
-            print(f"Error moving message {request_id}: {exception}")
-    
-    batch = service.new_batch_http_request(callback=callback)
-    
-    for email_id in email_ids:
-        batch.add(
-            service.users().messages().modify(
-                userId="me",
-                id=email_id,
-                body={"addLabelIds": [label_name]}
-            )
+
+    # Drop duplicate IDs (e.g. from threads) while keeping order
+    email_ids = list(dict.fromkeys(email_ids))
+
+    # One batchModify per 1000 IDs instead of a modify request per message
+    def build_request(service, ids):
+        return service.users().messages().batchModify(
+            userId="me",
+            body={"ids": ids, "addLabelIds": [label_name]}
         )
-    
-    batch.execute()
+
+    _execute_id_chunks(email_ids, build_request, "batchModify", "moving messages")
 
 def delete_email(email_id):
     """Move a single email to trash."""
     service = get_gmail_service()
+    get_rate_limiter().acquire(QUOTA_COSTS["trash"])
     service.users().messages().trash(userId="me", id=email_id).execute()
 
-def batch_delete_emails(email_ids):
-    """Move multiple emails to trash in a single batch operation."""
+def batch_delete_emails(email_ids, chunk_size=BATCH_CHUNK_SIZE):
+    """Move multiple emails to trash using concurrent batch operations."""
     if not email_ids:
         return
-        
-    service = get_gmail_service()
-    
-    def callback(request_id, response, exception):
-        if exception:
-            print(f"Error trashing message {request_id}: {exception}")
-    
-    batch = service.new_batch_http_request(callback=callback)
-    
-    for email_id in email_ids:
-        batch.add(
-            service.users().messages().trash(
-                userId="me",
-                id=email_id
-            )
+
+    # Drop duplicate IDs (e.g. from threads) while keeping order
+    email_ids = list(dict.fromkeys(email_ids))
+
+    def build_request(service, email_id):
+        return service.users().messages().trash(
+            userId="me",
+            id=email_id
         )
-    
-    batch.execute()
 
-def permanent_delete(query, batch_size=50):
+    _execute_batches(email_ids, build_request, "trash", "trashing message", chunk_size=chunk_size)
+
+def permanent_delete(query, batch_size=MAX_IDS_PER_REQUEST):
     """Permanently delete emails matching a query with batching."""
     service = get_gmail_service()
-    
+
     try:
-        # Only fetch IDs to reduce data transfer
-        results = service.users().messages().list(
-            userId="me", 
-            q=query, 
-            fields="messages/id,nextPageToken"
-        ).execute()
-        
-        messages = results.get("messages", [])
-        if not messages:
+        # Follow every result page so large queries are fully processed
+        message_ids = list_message_ids(service, query)
+        if not message_ids:
             return
-            
-        # Process in batches to reduce API calls
-        message_ids = [msg["id"] for msg in messages]
-        
-        for i in range(0, len(message_ids), batch_size):
-            batch_ids = message_ids[i:i+batch_size]
-            batch_permanent_delete(batch_ids)
-            
-            # Add delay between batches to avoid rate limiting
-            if i + batch_size < len(message_ids):
-                time.sleep(1)
-    
+
+        # Requests draw from the shared quota token bucket, no fixed sleep needed
+        batch_permanent_delete(message_ids, chunk_size=batch_size)
+
     except HttpError as error:
-        print(f"An error occurred: {error}")
+        logger.error("An error occurred: %s", error)
 
-def batch_permanent_delete(email_ids):
-    """Permanently delete multiple emails in a single batch operation."""
+def batch_permanent_delete(email_ids, chunk_size=MAX_IDS_PER_REQUEST):
+    """Permanently delete multiple emails using concurrent batch operations."""
     if not email_ids:
         return
-        
-    service = get_gmail_service()
-    
-    def callback(request_id, response, exception):
-        if exception:
-            print(f"Error deleting message {request_id}: {exception}")
-    
-    batch = service.new_batch_http_request(callback=callback)
-    
-    for email_id in email_ids:
-        batch.add(
-            service.users().messages().delete(
-                userId="me",
-                id=email_id
-            )
+
+    # Drop duplicate IDs (e.g. from threads) while keeping order
+    email_ids = list(dict.fromkeys(email_ids))
+
+    # One batchDelete per chunk of up to 1000 IDs instead of a delete request per message
+    def build_request(service, ids):
+        return service.users().messages().batchDelete(
+            userId="me",
+            body={"ids": ids}
         )
-    
-    batch.execute()
 
-def search_and_trash(query, batch_size=50):
+    _execute_id_chunks(email_ids, build_request, "batchDelete", "deleting messages", chunk_size=chunk_size)
+
+def search_and_trash(query, batch_size=BATCH_CHUNK_SIZE):
     """Search for emails matching a query and move them to trash with batching."""
     service = get_gmail_service()
-    
+
     try:
-        # Only fetch IDs to reduce data transfer
-        results = service.users().messages().list(
-            userId="me", 
-            q=query, 
-            fields="messages/id,nextPageToken"
-        ).execute()
-        
-        messages = results.get("messages", [])
-        if not messages:
+        # Follow every result page so large queries are fully processed
+        message_ids = list_message_ids(service, query)
+        if not message_ids:
             return
-            
-        # Process in batches to reduce API calls
-        message_ids = [msg["id"] for msg in messages]
-        
-        for i in range(0, len(message_ids), batch_size):
-            batch_ids = message_ids[i:i+batch_size]
-            batch_delete_emails(batch_ids)
-            
-            # Add delay between batches to avoid rate limiting
-            if i + batch_size < len(message_ids):
-                time.sleep(1)
-    
+
+        # Batches draw from the shared quota token bucket, no fixed sleep needed
+        batch_delete_emails(message_ids, chunk_size=batch_size)
+
     except HttpError as error:
-        print(f"An error occurred: {error}")
+        logger.error("An error occurred: %s", error)
+
+def _build_raw_reply(subject, body, to_email):
+    """Build a base64url encoded plain text reply for the drafts API."""
+    # Strip CR/LF from header values to prevent header injection
+    subject = re.sub(r"[\r\n]", " ", subject)
+    to_email = re.sub(r"[\r\n]", " ", to_email)
+    # Non-ASCII header values are RFC 2047 encoded, as MIMEText did
+    subject = f"Re: {subject}"
+    if not subject.isascii():
+        subject = Header(subject, "utf-8").encode(linesep="\r\n")
+    if not to_email.isascii():
+        to_email = formataddr(parseaddr(to_email), charset="utf-8")
+    message = (
+        "From: me\r\n"
+        f"To: {to_email}\r\n"
+        f"Subject: {subject}\r\n"
+        "MIME-Version: 1.0\r\n"
+        "Content-Type: text/plain; charset=utf-8\r\n"
+        "Content-Transfer-Encoding: 8bit\r\n"
+        "\r\n"
+        f"{body}"
+    )
+    return base64.urlsafe_b64encode(message.encode("utf-8")).decode("ascii")
 
-from llm_utils.classifier import generate_response # You will create this function
 def save_draft(subject, body, to_email):
     """Save a draft email with an automated response."""
     service = get_gmail_service()
-    
+
     # 1. Generate the automated response using a new function
     automated_response_body = generate_response(body)
 
-    # 2. Create the MIMEText message with the new response
-    message_text = MIMEText(automated_response_body)
-    message_text['Subject'] = f"Re: {subject}"
-    message_text['From'] = "me"
-    message_text['To'] = to_email
-
-    # 3. Encode the message to base64url string
-    raw_message = base64.urlsafe_b64encode(message_text.as_bytes()).decode('utf-8')
+    # 2. Build and encode the message with the new response
+    raw_message = _build_raw_reply(subject, automated_response_body, to_email)
 
     message = {
         "message": {
             "raw": raw_message
         }
     }
-    
+
     try:
+        get_rate_limiter().acquire(QUOTA_COSTS["drafts.create"])
         draft = service.users().drafts().create(userId="me", body=message).execute()
         return draft["id"]
     except HttpError as error:
-        print(f"An error occurred while saving draft: {error}")
+        logger.error("An error occurred while saving draft: %s", error)
         return None
 
 def batch_save_drafts(draft_data_list):
-    """Save multiple draft emails in a batch operation."""
+    """Save multiple draft emails using concurrent batch operations."""
     if not draft_data_list:
         return []
-        
-    service = get_gmail_service()
+
     draft_ids = []
-    
-    def callback(request_id, response, exception):
-        if exception:
-            print(f"Error saving draft {request_id}: {exception}")
-        else:
-            draft_ids.append(response.get("id"))
-    
-    batch = service.new_batch_http_request(callback=callback)
-    
-    for i, draft_data in enumerate(draft_data_list):
+    messages = []
+
+    # Only draft one reply per recipient and subject
+    seen = set()
+    unique_drafts = []
+    for draft_data in draft_data_list:
+        key = (draft_data.get("to_email", ""), draft_data.get("subject", ""))
+        if key not in seen:
+            seen.add(key)
+            unique_drafts.append(draft_data)
+
+    # Generate all responses concurrently, the LLM round-trips dominate
+    bodies = [draft_data.get("body", "") for draft_data in unique_drafts]
+    with ThreadPoolExecutor(max_workers=min(RESPONSE_WORKERS, len(bodies))) as executor:
+        responses = list(executor.map(generate_response, bodies))
+
+    for draft_data, automated_response_body in zip(unique_drafts, responses):
         subject = draft_data.get("subject", "")
-        body = draft_data.get("body", "")
         to_email = draft_data.get("to_email", "")
-        
-        # Generate response
-        automated_response_body = generate_response(body)
-        
-        # Create message
-        message_text = MIMEText(automated_response_body)
-        message_text['Subject'] = f"Re: {subject}"
-        message_text['From'] = "me"
-        message_text['To'] = to_email
-        
-        # Encode message
-        raw_message = base64.urlsafe_b64encode(message_text.as_bytes()).decode('utf-8')
-        
-        message = {
+
+        # Build and encode message
+        raw_message = _build_raw_reply(subject, automated_response_body, to_email)
+
+        messages.append({
             "message": {
                 "raw": raw_message
             }
-        }
-        
-        batch.add(
-            service.users().drafts().create(userId="me", body=message),
-            request_id=str(i)
-        )
-    
-    batch.execute()
+        })
+
+    def build_request(service, message):
+        return service.users().drafts().create(userId="me", body=message)
+
+    def on_success(message, response):
+        draft_ids.append(response.get("id"))
+
+    _execute_batches(messages, build_request, "drafts.create", "saving draft", on_success=on_success)
     return draft_ids
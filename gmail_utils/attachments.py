@@ -1,16 +1,24 @@
 import base64
+import hashlib
 import logging
-from io import BytesIO
-from typing import List, Dict, Tuple
+import os
+import tempfile
+import time
+from collections import deque
+from io import BytesIO, StringIO
+from email.message import EmailMessage
+from typing import List, Dict, Tuple, Optional
 
 from googleapiclient.errors import HttpError
-from config.settings import ATTACHMENT_SETTINGS
+from gmail_utils.ratelimit import QUOTA_COSTS, get_rate_limiter
+from config.settings import ATTACHMENT_SETTINGS, CACHE_SETTINGS
 
 # Optional imports for parsing attachments
 try:
-    from pdfminer.high_level import extract_text as pdf_extract_text
+    from pdfminer.high_level import extract_text_to_fp as pdf_extract_text_to_fp
+    from pdfminer.layout import LAParams
 except Exception:
-    pdf_extract_text = None
+    pdf_extract_text_to_fp = None
 
 try:
     import docx  # python-docx
@@ -24,16 +32,109 @@ except Exception:
 
 logger = logging.getLogger(__name__)
 
+# Extracted attachment text, keyed by SHA-256 of the attachment bytes
+ATTACHMENT_CACHE_DIR = os.path.join(CACHE_SETTINGS["CACHE_DIR"], "attachments")
+ATTACHMENT_CACHE_TTL = CACHE_SETTINGS["EMAIL_CACHE_TTL"]
+_cache_swept = False
+
+
+class _EnoughText(Exception):
+    """Raised to stop parsing once enough text has been extracted."""
+
+
+class _CappedTextBuffer(StringIO):
+    """Text buffer that stops the writer once max_len non-leading-space chars are in."""
+
+    def __init__(self, max_len: int):
+        super().__init__()
+        self.max_len = max_len
+
+    def write(self, s: str) -> int:
+        written = super().write(s)
+        if self.tell() > self.max_len and len(self.getvalue().lstrip()) > self.max_len:
+            raise _EnoughText()
+        return written
+
+
+def _extract_pdf(data: bytes, max_len: int) -> str:
+    buf = _CappedTextBuffer(max_len)
+    try:
+        pdf_extract_text_to_fp(BytesIO(data), buf, laparams=LAParams(), codec=None)
+    except _EnoughText:
+        pass
+    return buf.getvalue().strip()[:max_len]
+
+
+def _extract_docx(data: bytes, max_len: int) -> str:
+    doc = docx.Document(BytesIO(data))
+    paragraphs = []
+    length = 0
+    for p in doc.paragraphs:
+        paragraphs.append(p.text)
+        length += len(p.text) + 1
+        if length > max_len:
+            break
+    text = "\n".join(paragraphs)
+    return text.strip()[:max_len]
+
+
+def _extract_xlsx(data: bytes, max_len: int) -> str:
+    wb = openpyxl.load_workbook(filename=BytesIO(data), read_only=True, data_only=True)
+    text_chunks = []
+    length = 0
+    try:
+        for ws in wb.worksheets[:2]:  # limit sheets
+            rows_iter = ws.iter_rows(min_row=1, max_row=50, values_only=True)
+            for row in rows_iter:
+                row_vals = [str(v) if v is not None else "" for v in row]
+                if any(row_vals):
+                    line = "\t".join(row_vals)
+                    text_chunks.append(line)
+                    length += len(line) + 1
+                    if length > max_len:
+                        break
+            if length > max_len:
+                break
+    finally:
+        # Read-only workbooks keep the archive open until closed
+        wb.close()
+    text = "\n".join(text_chunks)
+    return text.strip()[:max_len]
+
+
+# MIME type -> extractor, registered only for parser libraries that imported
+_EXTRACTORS = {}
+if pdf_extract_text_to_fp:
+    _EXTRACTORS["application/pdf"] = _extract_pdf
+if docx:
+    _EXTRACTORS["application/vnd.openxmlformats-officedocument.wordprocessingml.document"] = _extract_docx
+    _EXTRACTORS["application/msword"] = _extract_docx
+if openpyxl:
+    _EXTRACTORS["application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"] = _extract_xlsx
+    _EXTRACTORS["application/vnd.ms-excel"] = _extract_xlsx
+
+# Settings bound once at import, these are read for every message
+_SUPPORTED_MIME_TYPES = frozenset(ATTACHMENT_SETTINGS["SUPPORTED_MIME_TYPES"])
+_MAX_SIZE_BYTES = ATTACHMENT_SETTINGS["MAX_SIZE_BYTES"]
+_MAX_TEXT_LENGTH = ATTACHMENT_SETTINGS["MAX_TEXT_LENGTH"]
+
 
 def _iter_parts(payload: Dict) -> List[Dict]:
-    """Recursively collect all parts from a Gmail message payload."""
+    """Collect all nested parts from a Gmail message payload, depth-first."""
     parts = []
     if not payload:
         return parts
-    if "parts" in payload and isinstance(payload["parts"], list):
-        for p in payload["parts"]:
-            parts.append(p)
-            parts.extend(_iter_parts(p))
+    pending = deque(payload.get("parts") or [])
+    while pending:
+        p = pending.popleft()
+        parts.append(p)
+        # text/* parts are leaves and never carry attachment sub-parts
+        if p.get("mimeType", "").startswith("text/"):
+            continue
+        children = p.get("parts")
+        if children and isinstance(children, list):
+            # Visit children before later siblings to keep document order
+            pending.extendleft(reversed(children))
     return parts
 
 
@@ -59,6 +160,7 @@ def find_attachments(payload: Dict) -> List[Dict]:
 
 def download_attachment(service, message_id: str, attachment_id: str) -> bytes:
     """Download attachment bytes using Gmail API."""
+    get_rate_limiter().acquire(QUOTA_COSTS["attachments.get"])
     att = service.users().messages().attachments().get(
         userId="me", messageId=message_id, id=attachment_id
     ).execute()
@@ -72,65 +174,102 @@ def download_attachment(service, message_id: str, attachment_id: str) -> bytes:
         return base64.b64decode(data)
 
 
-def extract_text_from_attachment(data: bytes, mime_type: str, filename: str) -> str:
-    """Extract text from attachment based on MIME type."""
-    max_len = ATTACHMENT_SETTINGS["MAX_TEXT_LENGTH"]
+def _sweep_attachment_cache() -> None:
+    """Remove cached attachment text older than the cache TTL."""
+    cutoff = time.time() - ATTACHMENT_CACHE_TTL
+    for root, _dirs, files in os.walk(ATTACHMENT_CACHE_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if os.stat(path).st_mtime < cutoff:
+                    os.remove(path)
+            except OSError:
+                continue
+
+
+def _attachment_cache_path(data: bytes) -> str:
+    key = hashlib.sha256(data).hexdigest()
+    return os.path.join(ATTACHMENT_CACHE_DIR, key[:2], key)
+
 
+def _read_cached_text(path: str) -> Optional[str]:
+    """Return cached text for an attachment, or None if missing or expired."""
     try:
-        if mime_type == "application/pdf" and pdf_extract_text:
-            text = pdf_extract_text(BytesIO(data))
-            return (text or "").strip()[:max_len]
-
-        if mime_type in (
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
-            "application/msword",
-        ) and docx:
-            doc = docx.Document(BytesIO(data))
-            text = "\n".join(p.text for p in doc.paragraphs)
-            return text.strip()[:max_len]
-
-        if mime_type in (
-            "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            "application/vnd.ms-excel",
-        ) and openpyxl:
-            wb = openpyxl.load_workbook(filename=BytesIO(data), read_only=True, data_only=True)
-            text_chunks = []
-            for ws in wb.worksheets[:2]:  # limit sheets
-                rows_iter = ws.iter_rows(min_row=1, max_row=50, values_only=True)
-                for row in rows_iter:
-                    row_vals = [str(v) if v is not None else "" for v in row]
-                    if any(row_vals):
-                        text_chunks.append("\t".join(row_vals))
-            text = "\n".join(text_chunks)
-            return text.strip()[:max_len]
-
-        # Fallback: unsupported types return empty string
+        if time.time() - os.stat(path).st_mtime >= ATTACHMENT_CACHE_TTL:
+            return None
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+def _write_cached_text(path: str, text: str) -> None:
+    """Atomically write extracted text to the attachment cache."""
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        logger.warning("Error caching attachment text: %s", e)
+
+
+def extract_text_from_attachment(data: bytes, mime_type: str, filename: str) -> str:
+    """
+    Extract text from attachment based on MIME type.
+    
+    Results are cached on disk by content hash, so the same attachment seen
+    again (replies, forwards) is not parsed twice.
+    """
+    global _cache_swept
+    max_len = _MAX_TEXT_LENGTH
+
+    if not _cache_swept:
+        _cache_swept = True
+        _sweep_attachment_cache()
+
+    cache_path = _attachment_cache_path(data)
+    cached = _read_cached_text(cache_path)
+    if cached is not None:
+        return cached[:max_len]
+
+    text = _parse_attachment(data, mime_type, filename)
+    if text is not None:
+        _write_cached_text(cache_path, text)
+        return text
+    return ""
+
+
+def _parse_attachment(data: bytes, mime_type: str, filename: str) -> Optional[str]:
+    """Parse attachment bytes into text. Returns None if parsing failed."""
+    extractor = _EXTRACTORS.get(mime_type)
+    if extractor is None:
+        # Fallback: unsupported types (or missing parser libraries) return empty string
         return ""
+    try:
+        return extractor(data, _MAX_TEXT_LENGTH)
     except Exception as e:
-        logger.warning(f"Error extracting text from attachment {filename}: {e}")
-        return ""
+        logger.warning("Error extracting text from attachment %s: %s", filename, e)
+        return None
 
 
-def process_message_attachments(service, message: Dict) -> Tuple[str, List[Dict]]:
-    """Download and parse attachments for a Gmail message. Returns (text, metadata)."""
-    payload = message.get("payload", {})
-    att_settings = ATTACHMENT_SETTINGS
-    supported = set(att_settings["SUPPORTED_MIME_TYPES"])
-    max_size = att_settings["MAX_SIZE_BYTES"]
+def _collect_attachment_text(attachments) -> Tuple[str, List[Dict]]:
+    """
+    Parse supported attachments into text.
 
-    attachments = find_attachments(payload)
-    if not attachments:
-        return "", []
+    Args:
+        attachments: Iterable of (filename, mimeType, size, load) where
+            load() returns the attachment bytes and is only called for
+            attachments that pass the type and size checks.
+    """
+    supported = _SUPPORTED_MIME_TYPES
+    max_size = _MAX_SIZE_BYTES
 
     text_parts = []
     meta: List[Dict] = []
 
-    for att in attachments:
-        mime = att.get("mimeType", "")
-        size = int(att.get("size", 0) or 0)
-        filename = att.get("filename", "")
-        attachment_id = att.get("attachmentId")
-
+    for filename, mime, size, load in attachments:
         meta.append({
             "filename": filename,
             "mimeType": mime,
@@ -139,18 +278,56 @@ def process_message_attachments(service, message: Dict) -> Tuple[str, List[Dict]
 
         # Skip unsupported or oversized attachments
         if mime not in supported or size > max_size:
-            logger.info(f"Skipping attachment {filename} (type={mime}, size={size})")
+            logger.info("Skipping attachment %s (type=%s, size=%s)", filename, mime, size)
             continue
 
         try:
-            data = download_attachment(service, message.get("id"), attachment_id)
-            extracted = extract_text_from_attachment(data, mime, filename)
+            extracted = extract_text_from_attachment(load(), mime, filename)
             if extracted:
                 text_parts.append(f"Attachment {filename} ({mime}):\n{extracted}")
         except HttpError as e:
-            logger.warning(f"Gmail API error downloading attachment {filename}: {e}")
+            logger.warning("Gmail API error downloading attachment %s: %s", filename, e)
         except Exception as e:
-            logger.warning(f"Unexpected error processing attachment {filename}: {e}")
+            logger.warning("Unexpected error processing attachment %s: %s", filename, e)
 
     combined_text = "\n\n".join(text_parts)
-    return combined_text, meta
\ No newline at end of file
+    return combined_text, meta
+
+
+def process_message_attachments(service, message: Dict) -> Tuple[str, List[Dict]]:
+    """Download and parse attachments for a Gmail message. Returns (text, metadata)."""
+    payload = message.get("payload", {})
+    # Only multipart messages (or a single-part attachment) can carry attachments
+    if not payload.get("mimeType", "").startswith("multipart/") and not payload.get("body", {}).get("attachmentId"):
+        return "", []
+
+    attachments = find_attachments(payload)
+    if not attachments:
+        return "", []
+
+    message_id = message.get("id")
+    return _collect_attachment_text(
+        (
+            att.get("filename", ""),
+            att.get("mimeType", ""),
+            int(att.get("size", 0) or 0),
+            lambda attachment_id=att.get("attachmentId"): download_attachment(service, message_id, attachment_id),
+        )
+        for att in attachments
+    )
+
+
+def process_mime_attachments(mime_message: EmailMessage) -> Tuple[str, List[Dict]]:
+    """Parse attachments of a message fetched with format=raw. Returns (text, metadata)."""
+    if not mime_message.is_multipart():
+        return "", []
+
+    def attachments():
+        for part in mime_message.walk():
+            filename = part.get_filename()
+            if not filename or part.is_multipart():
+                continue
+            data = part.get_payload(decode=True) or b""
+            yield filename, part.get_content_type(), len(data), lambda data=data: data
+
+    return _collect_attachment_text(attachments())
@@ -3,23 +3,23 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from google_auth_httplib2 import AuthorizedHttp
+import httplib2
 from dotenv import load_dotenv
-import os, json
+import os
 import logging
-from functools import lru_cache
+import tempfile
+import threading
 import time
+from contextlib import contextmanager
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
 from config.settings import CACHE_SETTINGS
-from gmail_utils.retry import retry_on_api_error, track_api_usage
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("gmail_automation.log"),
-        logging.StreamHandler()
-    ]
-)
+from gmail_utils.retry import retry_on_api_error, track_api_usage, on_auth_failure
+
 logger = logging.getLogger(__name__)
 
 load_dotenv()
@@ -29,78 +29,158 @@ SCOPES = ["https://www.googleapis.com/auth/gmail.labels",
           "https://www.googleapis.com/auth/gmail.readonly",
           "https://www.googleapis.com/auth/gmail.modify"]
 
-# Global service instance
-_gmail_service = None
-_last_service_time = 0
+# OAuth client config, built once from .env
+_CREDENTIALS_CONFIG = {
+    "installed": {
+        "client_id": os.getenv("GMAIL_CLIENT_ID"),
+        "project_id": "gmail-automation-project",
+        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
+        "token_uri": "https://oauth2.googleapis.com/token",
+        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
+        "client_secret": os.getenv("GMAIL_CLIENT_SECRET"),
+        "redirect_uris": ["http://localhost"]
+    }
+}
+
+# Shared credentials, reloaded once the service cache TTL expires
+_credentials = None
+_credentials_time = 0
+_credentials_generation = 0
+_credentials_lock = threading.Lock()
 _SERVICE_CACHE_TTL = CACHE_SETTINGS["SERVICE_CACHE_TTL"]
 
-@lru_cache(maxsize=1)
-@track_api_usage
-def get_gmail_service():
+# Per-thread service instances; httplib2 transports are not thread-safe
+_thread_local = threading.local()
+
+@contextmanager
+def _file_lock(path):
+    """Hold an exclusive lock on path + ".lock" across processes."""
+    with open(path + ".lock", "a+") as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def _atomic_write(path, data):
     """
-    Get Gmail service with caching to reduce API initialization calls.
-    Uses both a global variable and LRU cache for optimal performance.
-    Includes retry mechanisms and error handling.
+    Write data to path atomically.
+    
+    The data goes to a temporary file in the same directory which then
+    replaces path, so a crash mid-write never leaves a truncated file.
     """
-    global _gmail_service, _last_service_time
+    directory = os.path.dirname(os.path.abspath(path))
+    with _file_lock(path):
+        with tempfile.NamedTemporaryFile("w", dir=directory, delete=False) as tf:
+            tf.write(data)
+        try:
+            os.replace(tf.name, path)
+        except OSError:
+            os.remove(tf.name)
+            raise
+
+def _load_credentials():
+    """
+    Load OAuth credentials from token.json, refreshing or re-running the
+    consent flow when they are missing or expired.
+    """
+    creds = None
+    if os.path.exists("token.json"):
+        try:
+            creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+        except ValueError as e:
+            logger.warning("Ignoring unreadable token.json: %s", e)
     
-    # Return cached service if it exists and is not expired
-    current_time = time.time()
-    if _gmail_service and (current_time - _last_service_time) < _SERVICE_CACHE_TTL:
-        logger.debug("Using cached Gmail service")
-        return _gmail_service
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            logger.info("Refreshing expired credentials")
+            creds.refresh(Request())
+        else:
+            logger.info("Creating new credentials")
+            # Hand the client config to the flow directly, no secret file on disk
+            flow = InstalledAppFlow.from_client_config(_CREDENTIALS_CONFIG, SCOPES)
+            creds = flow.run_local_server(port=8888)
+
+        _atomic_write("token.json", creds.to_json())
+
+    return creds
+
+@track_api_usage
+def _refresh_credentials():
+    """Reload the shared credentials. Caller must hold _credentials_lock."""
+    global _credentials, _credentials_time, _credentials_generation
     
     logger.info("Initializing new Gmail service")
     
     try:
-        creds = None
-        if os.path.exists("token.json"):
-            creds = Credentials.from_authorized_user_file("token.json", SCOPES)
-        
-        if not creds or not creds.valid:
-            if creds and creds.expired and creds.refresh_token:
-                logger.info("Refreshing expired credentials")
-                creds.refresh(Request())
-            else:
-                logger.info("Creating new credentials")
-                # Build credentials.json dynamically from .env
-                credentials_data = {
-                    "installed": {
-                        "client_id": os.getenv("GMAIL_CLIENT_ID"),
-                        "project_id": "gmail-automation-project",
-                        "auth_uri": "https://accounts.google.com/o/oauth2/auth",
-                        "token_uri": "https://oauth2.googleapis.com/token",
-                        "auth_provider_x509_cert_url": "https://www.googleapis.com/oauth2/v1/certs",
-                        "client_secret": os.getenv("GMAIL_CLIENT_SECRET"),
-                        "redirect_uris": ["http://localhost"]
-                    }
-                }
-
-                # Save a temporary credentials.json file
-                with open("credentials.json", "w") as f:
-                    json.dump(credentials_data, f)
-
-                flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-                creds = flow.run_local_server(port=8888)
-
-            with open("token.json", "w") as token:
-                token.write(creds.to_json())
+        creds = _load_credentials()
 
         # Create cache directory if it doesn't exist
         os.makedirs(CACHE_SETTINGS["CACHE_DIR"], exist_ok=True)
         
-        _gmail_service = build("gmail", "v1", credentials=creds)
-        _last_service_time = current_time
+        _credentials = creds
+        _credentials_time = time.time()
+        _credentials_generation += 1
         logger.info("Gmail service initialized successfully")
-        return _gmail_service
         
     except HttpError as e:
-        logger.error(f"HTTP error during service initialization: {e}")
+        logger.error("HTTP error during service initialization: %s", e)
         raise
     except Exception as e:
-        logger.error(f"Error initializing Gmail service: {e}")
+        logger.error("Error initializing Gmail service: %s", e)
         raise
 
+def _get_credentials():
+    """Get the shared credentials, reloading them when the TTL has expired."""
+    with _credentials_lock:
+        if _credentials is None or (time.time() - _credentials_time) >= _SERVICE_CACHE_TTL:
+            _refresh_credentials()
+        return _credentials, _credentials_generation
+
+@on_auth_failure
+def invalidate_gmail_service():
+    """
+    Drop the shared credentials so the next get_gmail_service() reloads
+    them; every thread then rebuilds its service for the new generation.
+    """
+    global _credentials
+    with _credentials_lock:
+        _credentials = None
+    logger.info("Gmail service invalidated")
+
+def build_gmail_service(creds):
+    """Build a Gmail service bound to its own HTTP connection."""
+    http = AuthorizedHttp(creds, http=httplib2.Http())
+    return build("gmail", "v1", http=http)
+
+def get_gmail_service():
+    """
+    Get the Gmail service for the calling thread.
+    
+    Credentials are loaded once and shared behind a lock; each thread gets
+    its own Resource over a dedicated AuthorizedHttp transport, since
+    httplib2.Http objects are not thread-safe. Services are rebuilt when
+    the credentials are reloaded after the service cache TTL.
+    """
+    creds, generation = _get_credentials()
+    
+    cached = getattr(_thread_local, "service", None)
+    if cached and cached[0] == generation:
+        logger.debug("Using cached Gmail service")
+        return cached[1]
+    
+    service = build_gmail_service(creds)
+    _thread_local.service = (generation, service)
+    return service
+
 if __name__ == "__main__":
     print("🔑 Starting Gmail OAuth setup...")
     service = get_gmail_service()
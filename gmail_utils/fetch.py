@@ -1,20 +1,37 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from gmail_utils.auth import get_gmail_service
-from gmail_utils.retry import retry_on_api_error, safe_api_call
-from gmail_utils.monitor import track_api_call
+from gmail_utils.retry import RETRYABLE_STATUSES, exponential_backoff, retry_after_seconds, retry_on_api_error, safe_api_call
+from gmail_utils.monitor import track_api_call, get_quota_monitor
+from gmail_utils.ratelimit import QUOTA_COSTS, get_rate_limiter
 from config.settings import CACHE_SETTINGS, API_SETTINGS, EMAIL_SETTINGS
-import base64
+import binascii
+import email
+import email.policy
+from email.utils import parseaddr
 import os
+import re
+import sqlite3
+import threading
 import json
 import time
 import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from collections import deque
+from itertools import islice
 from googleapiclient.errors import HttpError
 from googleapiclient.http import BatchHttpRequest
-from gmail_utils.attachments import process_message_attachments
+from gmail_utils.attachments import process_message_attachments, process_mime_attachments
 from config.settings import ATTACHMENT_SETTINGS
 
+# Optional fast JSON (de)serializer for the email cache
+try:
+    import orjson
+except Exception:
+    orjson = None
+
 # Configure logging
 logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
 
 # Cache directory
 CACHE_DIR = CACHE_SETTINGS["CACHE_DIR"]
@@ -23,32 +40,139 @@ os.makedirs(CACHE_DIR, exist_ok=True)
 # Cache TTL in seconds
 EMAIL_CACHE_TTL = CACHE_SETTINGS["EMAIL_CACHE_TTL"]
 
-def _extract_email_content(message):
-    """Extract email content from a Gmail message object."""
+# One lock per email cache key, so a list is only fetched by one thread at a time
+_fetch_locks = {}
+_fetch_locks_lock = threading.Lock()
+
+# Largest page Gmail returns for messages.list
+MAX_LIST_PAGE_SIZE = 500
+
+# Per-message cache; message content is immutable by ID so entries never expire
+MESSAGE_CACHE_DB = os.path.join(CACHE_DIR, "emails.sqlite")
+_message_cache_db = None
+_message_cache_lock = threading.Lock()
+
+# History ID of the last fetch_new_emails() listing, saved as the checkpoint
+# only once the caller confirms the emails were processed
+_pending_history_id = None
+
+# Worker threads fetching message chunks concurrently
+MAX_FETCH_WORKERS = API_SETTINGS["MAX_FETCH_WORKERS"]
+
+# Fetch messages with format=raw and parse the MIME locally
+FETCH_RAW = EMAIL_SETTINGS["FETCH_RAW"]
+
+# Messages fetched per batch HTTP call
+BATCH_CHUNK_SIZE = API_SETTINGS["BATCH_CHUNK_SIZE"]
+
+# Retries for batch members failing with a retryable status
+MAX_RETRIES = API_SETTINGS["MAX_RETRIES"]
+BACKOFF_CAP = API_SETTINGS["BACKOFF_CAP"]
+
+# Address part of a From header, e.g. "Jane Doe <jane@example.com>"
+_FROM_RE = re.compile(r"<([^<>]+)>[^<]*$")
+
+# Maps the base64url alphabet onto standard base64 in a single translate pass
+_B64URL_TABLE = bytes.maketrans(b"-_", b"+/")
+
+def _b64url_decode(data):
+    """Decode base64url str/bytes. Raises binascii.Error if malformed."""
+    if isinstance(data, str):
+        data = data.encode("ascii")
+    data = data.translate(_B64URL_TABLE)
+    # Gmail may omit the trailing padding; avoid another copy when it doesn't
+    padding = -len(data) % 4
+    if padding:
+        data += b"=" * padding
+    return binascii.a2b_base64(data)
+
+def _decode_body(data):
+    """Decode a base64url Gmail body to text, returning "" if it is malformed."""
+    try:
+        return _b64url_decode(data).decode("utf-8", errors="ignore")
+    except (binascii.Error, ValueError) as e:
+        logger.warning("Could not decode message body: %s", e)
+        return ""
+
+def _parse_raw_message(raw):
+    """Parse the base64url RFC 822 blob returned for format=raw, or an empty message if it is malformed."""
+    try:
+        data = _b64url_decode(raw)
+    except (binascii.Error, ValueError) as e:
+        logger.warning("Could not decode raw message: %s", e)
+        data = b""
+    return email.message_from_bytes(data, policy=email.policy.default)
+
+def _mime_body_text(mime_message):
+    """Get the text body of a parsed message, preferring text/plain."""
+    part = mime_message.get_body(preferencelist=("plain", "html"))
+    if part is None:
+        return ""
+    try:
+        return part.get_content()
+    except (LookupError, UnicodeError):
+        # Unknown or wrong charset declared, decode leniently
+        return (part.get_payload(decode=True) or b"").decode("utf-8", errors="ignore")
+
+def _extract_email_content(message, mime_message=None):
+    """
+    Extract email content from a Gmail message object.
+    
+    Handles both format=raw messages (parsed locally, mime_message may be
+    passed in when already parsed) and the JSON payload tree.
+    """
+    if "raw" in message:
+        if mime_message is None:
+            mime_message = _parse_raw_message(message["raw"])
+        # policy.default decodes RFC 2047 encoded headers
+        from_header = str(mime_message.get("From", ""))
+        return {
+            "id": message["id"],
+            "subject": str(mime_message.get("Subject", "")),
+            "body": _mime_body_text(mime_message),
+            "internalDate": int(message.get("internalDate", 0)),
+            "to_email": parseaddr(from_header)[1] or from_header.strip()
+        }
+
     payload = message.get("payload", {})
     headers = payload.get("headers", [])
 
-    subject = next((h["value"] for h in headers if h["name"].lower() == "subject"), "")
+    # Single pass over the headers, stopping once both are found;
+    # the first occurrence of a name wins
+    subject = from_header = None
+    for h in headers:
+        name = h["name"].lower()
+        if name == "subject":
+            if subject is None:
+                subject = h["value"]
+        elif name == "from":
+            if from_header is None:
+                from_header = h["value"]
+        else:
+            continue
+        if subject is not None and from_header is not None:
+            break
+    subject = subject or ""
     
     # Extract the sender's email address if present in headers
-    from_header = next((h["value"] for h in headers if h["name"].lower() == "from"), "")
-    to_email = ""
-    if "<" in from_header and ">" in from_header:
-        to_email = from_header.split("<")[-1].replace(">", "").strip()
-    else:
-        to_email = from_header.strip()
+    from_header = from_header or ""
+    match = _FROM_RE.search(from_header)
+    to_email = match.group(1).strip() if match else from_header.strip()
 
     # Gmail gives body in Base64 -> decode safely
-    body = ""
-    if "body" in payload and "data" in payload["body"]:
-        body = base64.urlsafe_b64decode(payload["body"]["data"]).decode("utf-8", errors="ignore")
-    else:
-        # Sometimes body is nested inside parts
-        parts = payload.get("parts", [])
-        for part in parts:
-            if part.get("mimeType") == "text/plain" and "data" in part.get("body", {}):
-                body = base64.urlsafe_b64decode(part["body"]["data"]).decode("utf-8", errors="ignore")
-                break
+    body_data = payload.get("body", {}).get("data")
+    if not body_data:
+        # Body is nested inside parts, possibly several levels deep
+        # (e.g. multipart/mixed > multipart/alternative > text/plain)
+        stack = deque(payload.get("parts") or [])
+        while stack:
+            part = stack.popleft()
+            if part.get("mimeType") == "text/plain":
+                body_data = part.get("body", {}).get("data")
+                if body_data:
+                    break
+            stack.extend(part.get("parts") or [])
+    body = _decode_body(body_data) if body_data else ""
 
     return {
         "id": message["id"],
@@ -59,23 +183,351 @@ def _extract_email_content(message):
     }
 
 
+def iter_message_ids(service, query, max_results=None):
+    """
+    Yield the message IDs matching a query as result pages arrive,
+    following nextPageToken.
+    
+    Args:
+        service: Gmail API service
+        query (str): Gmail search query
+        max_results (int): Stop after this many IDs (None for all matches)
+        
+    Yields:
+        str: Message IDs in the order returned by Gmail
+    """
+    listed = 0
+    page_token = None
+    while True:
+        page_size = MAX_LIST_PAGE_SIZE
+        if max_results is not None:
+            page_size = min(page_size, max_results - listed)
+        get_rate_limiter().acquire(QUOTA_COSTS["list"])
+        # Only fetch IDs to reduce data transfer
+        results = service.users().messages().list(
+            userId="me",
+            q=query,
+            maxResults=page_size,
+            pageToken=page_token,
+            fields="messages/id,nextPageToken"
+        ).execute()
+        
+        for msg in results.get("messages", []):
+            yield msg["id"]
+            listed += 1
+        page_token = results.get("nextPageToken")
+        if not page_token or (max_results is not None and listed >= max_results):
+            return
+
+
+def list_message_ids(service, query, max_results=None):
+    """
+    List the IDs of all messages matching a query, following nextPageToken.
+    
+    Args:
+        service: Gmail API service
+        query (str): Gmail search query
+        max_results (int): Stop after this many IDs (None for all matches)
+        
+    Returns:
+        list: Message IDs in the order returned by Gmail
+    """
+    return list(iter_message_ids(service, query, max_results))
+
+
+def _batch_get_messages(service, message_ids, batch_size=API_SETTINGS["BATCH_CHUNK_SIZE"]):
+    """
+    Fetch full messages with one batch HTTP call per batch_size IDs.
+    
+    Batch members that fail with a retryable status are re-sent with
+    exponential backoff (or the server's Retry-After). If a whole batch
+    call fails, its messages are fetched one by one instead. A 401 is
+    raised, so retry_on_api_error can reload the credentials. Batches
+    wait on the shared quota token bucket only when it is empty.
+    
+    Returns:
+        list: Message resources in the same order as message_ids; messages
+              that failed to fetch are logged and skipped.
+    """
+    messages = {}
+    rate_limiter = get_rate_limiter()
+    failed = []
+    retry_after = []
+    auth_errors = []
+    
+    def get_request(msg_id):
+        if FETCH_RAW:
+            # One base64url blob instead of the JSON MIME tree
+            return service.users().messages().get(
+                userId="me",
+                id=msg_id,
+                format="raw",
+                fields="id,raw,internalDate"
+            )
+        # Fetch minimal fields needed for each message
+        return service.users().messages().get(
+            userId="me",
+            id=msg_id,
+            fields="id,payload/headers,payload/body,payload/parts,internalDate"
+        )
+    
+    def callback(request_id, response, exception):
+        if exception is None:
+            messages[request_id] = response
+        elif isinstance(exception, HttpError) and exception.resp.status == 401:
+            auth_errors.append(exception)
+        elif isinstance(exception, HttpError) and exception.resp.status in RETRYABLE_STATUSES:
+            failed.append(request_id)
+            delay = retry_after_seconds(exception)
+            if delay is not None:
+                retry_after.append(delay)
+        else:
+            logger.warning("Error fetching message %s: %s", request_id, exception)
+    
+    def fetch_one_by_one(chunk):
+        for msg_id in chunk:
+            try:
+                rate_limiter.acquire(QUOTA_COSTS["get"])
+                messages[msg_id] = get_request(msg_id).execute()
+            except HttpError as error:
+                if error.resp.status == 401:
+                    raise
+                logger.warning("Error fetching message %s: %s", msg_id, error)
+    
+    for i in range(0, len(message_ids), batch_size):
+        pending = message_ids[i:i + batch_size]
+        for attempt in range(MAX_RETRIES + 1):
+            failed.clear()
+            retry_after.clear()
+            batch = service.new_batch_http_request(callback=callback)
+            for msg_id in pending:
+                batch.add(get_request(msg_id), request_id=msg_id)
+            rate_limiter.acquire(len(pending) * QUOTA_COSTS["get"])
+            try:
+                batch.execute()
+            except HttpError as error:
+                if error.resp.status == 401:
+                    raise
+                logger.warning("Batch fetch failed, falling back to single requests: %s", error)
+                fetch_one_by_one([msg_id for msg_id in pending if msg_id not in messages])
+                break
+            if auth_errors:
+                raise auth_errors[0]
+            if not failed:
+                break
+            if attempt == MAX_RETRIES:
+                logger.warning("Giving up on %d messages after %d retries", len(failed), MAX_RETRIES)
+                break
+            
+            # Honor the server's Retry-After when given, otherwise back off
+            delay = max(retry_after) if retry_after else min(BACKOFF_CAP, exponential_backoff(attempt))
+            logger.warning("Retrying %d failed message fetches in %.2fs", len(failed), delay)
+            time.sleep(delay)
+            pending = list(failed)
+    
+    return [messages[msg_id] for msg_id in message_ids if msg_id in messages]
+
+
+def _dumps(obj):
+    return orjson.dumps(obj) if orjson else json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def _loads(data):
+    return orjson.loads(data) if orjson else json.loads(data)
+
+
 def _get_cached_emails(cache_key, max_age=EMAIL_CACHE_TTL):
     cache_path = os.path.join(CACHE_DIR, f"{cache_key}.json")
-    if os.path.exists(cache_path):
-        age = time.time() - os.path.getmtime(cache_path)
-        if age < max_age:
-            with open(cache_path, "r", encoding="utf-8") as f:
-                try:
-                    return json.load(f)
-                except Exception:
-                    return None
+    try:
+        st = os.stat(cache_path)
+    except FileNotFoundError:
+        return None
+    if time.time() - st.st_mtime < max_age:
+        with open(cache_path, "rb") as f:
+            try:
+                return _loads(f.read())
+            except Exception:
+                return None
     return None
 
 
+def _fetch_lock(cache_key):
+    with _fetch_locks_lock:
+        return _fetch_locks.setdefault(cache_key, threading.Lock())
+
+
 def _save_emails_to_cache(emails, cache_key):
     cache_path = os.path.join(CACHE_DIR, f"{cache_key}.json")
-    with open(cache_path, "w", encoding="utf-8") as f:
-        json.dump(emails, f, ensure_ascii=False)
+    # Write to a temp file and swap it in so readers never see a partial file
+    tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_dumps(emails))
+    os.replace(tmp_path, cache_path)
+
+def _get_message_cache_db():
+    """Open the per-message cache database on first use. Caller must hold _message_cache_lock."""
+    global _message_cache_db
+    if _message_cache_db is None:
+        db = sqlite3.connect(MESSAGE_CACHE_DB, isolation_level=None, check_same_thread=False)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.execute("CREATE TABLE IF NOT EXISTS msg(id TEXT PRIMARY KEY, body BLOB, ts INTEGER)")
+        db.execute("CREATE TABLE IF NOT EXISTS state(key TEXT PRIMARY KEY, value TEXT)")
+        _message_cache_db = db
+    return _message_cache_db
+
+
+def _get_cached_messages(message_ids):
+    """Look up extracted emails by message ID. Returns {id: email}."""
+    if not message_ids:
+        return {}
+    placeholders = ",".join("?" * len(message_ids))
+    try:
+        with _message_cache_lock:
+            rows = _get_message_cache_db().execute(
+                f"SELECT id, body FROM msg WHERE id IN ({placeholders})", message_ids
+            ).fetchall()
+        return {msg_id: _loads(body) for msg_id, body in rows}
+    except (sqlite3.Error, ValueError) as e:
+        logger.warning("Error reading message cache: %s", e)
+        return {}
+
+
+def _cache_messages(emails):
+    """Store extracted emails in the per-message cache."""
+    if not emails:
+        return
+    now = int(time.time())
+    rows = [(email["id"], _dumps(email), now) for email in emails]
+    try:
+        with _message_cache_lock:
+            db = _get_message_cache_db()
+            with db:
+                db.executemany("INSERT OR REPLACE INTO msg(id, body, ts) VALUES (?, ?, ?)", rows)
+    except sqlite3.Error as e:
+        logger.warning("Error writing message cache: %s", e)
+
+
+def _get_cache_state(key):
+    """Read a checkpoint value (e.g. last_history_id) from the cache database."""
+    try:
+        with _message_cache_lock:
+            row = _get_message_cache_db().execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+    except sqlite3.Error as e:
+        logger.warning("Error reading cache state %s: %s", key, e)
+        return None
+
+
+def _set_cache_state(key, value):
+    """Store a checkpoint value in the cache database."""
+    try:
+        with _message_cache_lock:
+            _get_message_cache_db().execute(
+                "INSERT OR REPLACE INTO state(key, value) VALUES (?, ?)", (key, str(value))
+            )
+    except sqlite3.Error as e:
+        logger.warning("Error writing cache state %s: %s", key, e)
+
+
+def _build_email(service, message, include_attachments):
+    """Extract a fetched message and attach the text of its attachments."""
+    if "raw" in message:
+        # Parse once; attachments are inline so nothing is downloaded
+        mime_message = _parse_raw_message(message["raw"])
+        email_data = _extract_email_content(message, mime_message)
+        att_text, att_meta = process_mime_attachments(mime_message)
+    else:
+        email_data = _extract_email_content(message)
+        # Extract attachments content
+        att_text, att_meta = process_message_attachments(service, message)
+    email_data["attachments_text"] = att_text
+    email_data["attachments_meta"] = att_meta
+    if include_attachments and att_text:
+        # Append attachment text to body for richer context
+        email_data["body"] = f"{email_data['body']}\n\n{att_text}".strip()
+    return email_data
+
+
+def _fetch_emails(message_ids):
+    """
+    Fetch and extract the emails for an iterable of message IDs.
+    
+    Message IDs are grouped into batch-sized chunks as they are listed and
+    each chunk is handed to a worker thread as soon as it fills, so batch
+    fetches overlap the list calls for the following pages when message_ids
+    is a generator such as iter_message_ids(). Workers
+    use their own service from get_gmail_service(), since the underlying
+    httplib2 transport is not thread-safe. Messages already in the
+    per-message cache are not fetched again.
+    
+    Returns:
+        list: Email dicts in the order of message_ids
+    """
+    include_attachments = ATTACHMENT_SETTINGS.get("INCLUDE_IN_CONTEXT", True)
+    use_message_cache = CACHE_SETTINGS["USE_CACHE"]
+    
+    def fetch_chunk(message_ids):
+        cached = _get_cached_messages(message_ids) if use_message_cache else {}
+        missing = [msg_id for msg_id in message_ids if msg_id not in cached]
+        if missing:
+            worker_service = get_gmail_service()
+            fetched = [
+                _build_email(worker_service, m, include_attachments)
+                for m in _batch_get_messages(worker_service, missing)
+            ]
+            if use_message_cache:
+                _cache_messages(fetched)
+            cached.update((email["id"], email) for email in fetched)
+        return [cached[msg_id] for msg_id in message_ids if msg_id in cached]
+    
+    # Fall back to a single worker when close to the daily quota. The hourly
+    # should_throttle() check is not used, a one-shot run puts all of the
+    # day's usage in the current hour and would always trip it
+    max_workers = 1 if get_quota_monitor().near_daily_quota() else MAX_FETCH_WORKERS
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        message_ids = iter(message_ids)
+        futures = {}
+        while True:
+            chunk = list(islice(message_ids, BATCH_CHUNK_SIZE))
+            if not chunk:
+                break
+            futures[executor.submit(fetch_chunk, chunk)] = len(futures)
+        chunks = [None] * len(futures)
+        for future in as_completed(futures):
+            chunks[futures[future]] = future.result()
+    
+    return [email for chunk in chunks for email in chunk]
+
+# after: queries keyed by (UTC date, days); only today's entries are kept
+_QUERY_CACHE = {}
+
+def _after_query(days):
+    """Build the search query for mail from the last `days` days, cached per UTC day."""
+    today = datetime.now(timezone.utc).date()
+    key = (today, days)
+    query = _QUERY_CACHE.get(key)
+    if query is None:
+        if _QUERY_CACHE and next(iter(_QUERY_CACHE))[0] != today:
+            _QUERY_CACHE.clear()
+        query = f"after:{(today - timedelta(days=days)).strftime('%Y/%m/%d')}"
+        _QUERY_CACHE[key] = query
+    return query
+
+def _load_existing_emails(max_results, cache_key, use_cache):
+    """Fetch emails from the last N days from the Gmail API and cache them."""
+    logger.info("Fetching %s existing emails from Gmail API", max_results)
+    service = get_gmail_service()
+    query = _after_query(EMAIL_SETTINGS["DAYS_LOOKBACK"])
+
+    # Stream IDs into concurrent batch fetches
+    emails = _fetch_emails(iter_message_ids(service, query, max_results))
+    logger.info("Fetched %d existing emails", len(emails))
+    
+    # Save to cache for future use
+    if emails and use_cache:
+        _save_emails_to_cache(emails, cache_key)
+        
+    return emails
 
 @retry_on_api_error()
 @track_api_call("fetch_existing_emails", quota_cost=5)
@@ -84,81 +536,109 @@ def fetch_existing_emails(max_results=EMAIL_SETTINGS["DEFAULT_EMAIL_COUNT"], use
     Fetch emails from the last N days with subject, body, and internalDate.
     Uses caching, monitoring, and retry mechanisms for efficiency.
     """
-    # Try to get from cache first
     cache_key = f"existing_emails_{max_results}"
-    if use_cache:
-        cached_emails = _get_cached_emails(cache_key)
-        if cached_emails:
-            logger.info(f"Using cached existing emails ({len(cached_emails)} emails)")
-            return cached_emails
+    try:
+        # Concurrent callers wait for a single fetch instead of each listing again
+        with _fetch_lock(cache_key):
+            # Try to get from cache first
+            if use_cache:
+                cached_emails = _get_cached_emails(cache_key)
+                if cached_emails:
+                    logger.info("Using cached existing emails (%d emails)", len(cached_emails))
+                    return cached_emails
+            return _load_existing_emails(max_results, cache_key, use_cache)
     
-    logger.info(f"Fetching {max_results} existing emails from Gmail API")
-    service = get_gmail_service()
-    days_ago = (datetime.utcnow() - timedelta(days=EMAIL_SETTINGS["DAYS_LOOKBACK"]))
-    query = f"after:{days_ago.strftime('%Y/%m/%d')}"
+    except HttpError as error:
+        # Let retry_on_api_error reload stale credentials
+        if error.resp.status == 401:
+            raise
+        logger.error("An error occurred: %s", error)
+        return []
 
-    try:
-        # Use fields parameter to only fetch the data we need
-        results = service.users().messages().list(
-            userId="me", 
-            q=query, 
-            maxResults=max_results,
-            fields="messages/id,nextPageToken"
+
+def _list_added_message_ids(service, start_history_id, max_results):
+    """
+    List up to max_results unread messages added since a history checkpoint.
+    
+    Returns:
+        tuple: (message IDs in arrival order, latest history ID). The
+        history ID is None when more than max_results messages were
+        added, so the ones left out are listed again next time.
+    """
+    rate_limiter = get_rate_limiter()
+    message_ids = {}
+    history_id = start_history_id
+    page_token = None
+    while True:
+        rate_limiter.acquire(QUOTA_COSTS["history.list"])
+        results = service.users().history().list(
+            userId="me",
+            startHistoryId=start_history_id,
+            historyTypes=["messageAdded"],
+            labelId="UNREAD",
+            pageToken=page_token,
+            fields="history/messagesAdded/message/id,historyId,nextPageToken"
         ).execute()
         
-        message_ids = [msg["id"] for msg in results.get("messages", [])]
-        logger.info(f"Found {len(message_ids)} existing emails")
-        
-        # Use batch processing for better efficiency
-        if not message_ids:
-            return []
-        
-        # Use batch requests to reduce API calls
-        emails = []
-        batch_size = 10  # Process in batches of 10
-        include_attachments = ATTACHMENT_SETTINGS.get("INCLUDE_IN_CONTEXT", True)
-        
-        for i in range(0, len(message_ids), batch_size):
-            batch_ids = message_ids[i:i+batch_size]
-            
-            # Fetch minimal fields needed for each message
-            for msg_id in batch_ids:
-                try:
-                    m = service.users().messages().get(
-                        userId="me", 
-                        id=msg_id,
-                        fields="id,payload/headers,payload/body,payload/parts,internalDate"
-                    ).execute()
-                    
-                    email_data = _extract_email_content(m)
-                    # Extract attachments content
-                    att_text, att_meta = process_message_attachments(service, m)
-                    email_data["attachments_text"] = att_text
-                    email_data["attachments_meta"] = att_meta
-                    if include_attachments and att_text:
-                        # Append attachment text to body for richer context
-                        email_data["body"] = f"{email_data['body']}\n\n{att_text}".strip()
-                    emails.append(email_data)
-                    
-                    # Add small delay between requests to avoid rate limiting
-                    time.sleep(API_SETTINGS.get("API_CALL_DELAY", 0.1))
-                except HttpError as error:
-                    logger.warning(f"Error fetching message {msg_id}: {error}")
-                    continue
-        
-        # Save to cache for future use
-        if emails and use_cache:
-            _save_emails_to_cache(emails, cache_key)
-            
-        return emails
+        for record in results.get("history", []):
+            for added in record.get("messagesAdded", []):
+                message_ids[added["message"]["id"]] = None
+        history_id = results.get("historyId", history_id)
+        page_token = results.get("nextPageToken")
+        if len(message_ids) > max_results:
+            logger.info("More than %d new emails, not checkpointing yet", max_results)
+            return list(message_ids)[:max_results], None
+        if not page_token:
+            return list(message_ids), history_id
+
+
+def _new_message_ids(service, max_results):
+    """
+    Get the IDs of unread messages that arrived since the last call.
     
-    except HttpError as error:
-        logger.error(f"An error occurred: {error}")
-        return []
+    The first call (or one whose checkpoint Gmail no longer has) lists up
+    to max_results unread messages and records the mailbox history ID.
+    Later calls only ask history.list for up to max_results messages
+    added since then, so the cost follows the number of new messages,
+    not the mailbox size.
+    
+    Returns:
+        tuple: (message IDs, history ID to checkpoint). The history ID is
+        None when more than max_results messages were found, so the ones
+        left out are listed again instead of being skipped.
+    """
+    last_history_id = _get_cache_state("last_history_id")
+    if last_history_id is not None:
+        try:
+            return _list_added_message_ids(service, last_history_id, max_results)
+        except HttpError as error:
+            # 404 means the checkpoint is too old for Gmail to replay
+            if error.resp.status != 404:
+                raise
+            logger.warning("History checkpoint expired, listing unread emails again")
+    
+    # Take the history ID before listing so nothing arriving in between is missed
+    get_rate_limiter().acquire(QUOTA_COSTS["getProfile"])
+    history_id = service.users().getProfile(userId="me", fields="historyId").execute()["historyId"]
+    # One extra ID tells whether the listing was cut short
+    message_ids = list_message_ids(service, "is:unread", max_results + 1)
+    if len(message_ids) > max_results:
+        logger.info("More than %d unread emails, not checkpointing yet", max_results)
+        return message_ids[:max_results], None
+    return message_ids, history_id
 
 
+@retry_on_api_error()
 def fetch_new_emails(max_results=5, use_cache=False):
-    """Fetch new (unread) emails from Gmail."""
+    """
+    Fetch new (unread) emails from Gmail.
+    
+    Only messages added since the last confirmed call are returned, see
+    _new_message_ids(); max_results bounds the first, full listing. Call
+    commit_new_emails_checkpoint() once the emails have been processed,
+    until then the next call returns them again.
+    """
+    global _pending_history_id
     # For unread emails, we use a shorter cache time or no cache
     cache_key = "unread_emails"
     cache_ttl = CACHE_SETTINGS.get("UNREAD_CACHE_TTL", 300)
@@ -171,42 +651,15 @@ def fetch_new_emails(max_results=5, use_cache=False):
     service = get_gmail_service()
     
     try:
-        # Use fields parameter to only fetch the data we need
-        results = service.users().messages().list(
-            userId="me", 
-            q="is:unread", 
-            maxResults=max_results,
-            fields="messages/id,nextPageToken"
-        ).execute()
-        
-        message_ids = [msg["id"] for msg in results.get("messages", [])]
+        message_ids, history_id = _new_message_ids(service, max_results)
+        emails = _fetch_emails(message_ids)
         
-        # Use batch requests to reduce API calls
-        emails = []
-        include_attachments = ATTACHMENT_SETTINGS.get("INCLUDE_IN_CONTEXT", True)
-        
-        for msg_id in message_ids:
-            try:
-                m = service.users().messages().get(
-                    userId="me", 
-                    id=msg_id,
-                    fields="id,payload/headers,payload/body,payload/parts,internalDate"
-                ).execute()
-                
-                email_data = _extract_email_content(m)
-                # Extract attachments content
-                att_text, att_meta = process_message_attachments(service, m)
-                email_data["attachments_text"] = att_text
-                email_data["attachments_meta"] = att_meta
-                if include_attachments and att_text:
-                    email_data["body"] = f"{email_data['body']}\n\n{att_text}".strip()
-                emails.append(email_data)
-                
-                # Add small delay between requests to avoid rate limiting
-                time.sleep(API_SETTINGS.get("API_CALL_DELAY", 0.1))
-            except HttpError as error:
-                logger.warning(f"Error fetching message {msg_id}: {error}")
-                continue
+        # The checkpoint only advances once the caller confirms these emails,
+        # and not at all if some of them could not be fetched
+        if len(emails) < len(message_ids):
+            logger.warning("Fetched %d of %d new emails, not checkpointing yet", len(emails), len(message_ids))
+            history_id = None
+        _pending_history_id = history_id
         
         # Save to cache for future use if enabled
         if emails and use_cache:
@@ -215,5 +668,20 @@ def fetch_new_emails(max_results=5, use_cache=False):
         return emails
     
     except HttpError as error:
-        logger.error(f"An error occurred: {error}")
-        return []
\ No newline at end of file
+        # Let retry_on_api_error reload stale credentials
+        if error.resp.status == 401:
+            raise
+        logger.error("An error occurred: %s", error)
+        return []
+
+
+def commit_new_emails_checkpoint():
+    """
+    Advance the new-emails checkpoint past the last fetch_new_emails() listing.
+    
+    Call after the fetched emails were processed successfully.
+    """
+    global _pending_history_id
+    if _pending_history_id is not None:
+        _set_cache_state("last_history_id", _pending_history_id)
+        _pending_history_id = None
@@ -2,12 +2,16 @@
 Monitoring utilities for Gmail API usage and quota tracking.
 """
 
+import atexit
 import json
 import os
+import tempfile
+import threading
 import time
 import logging
 from datetime import datetime, timedelta
-from config.settings import API_SETTINGS, CACHE_SETTINGS
+from config.settings import CACHE_SETTINGS
+from gmail_utils.ratelimit import get_rate_limiter
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -16,6 +20,7 @@ logger = logging.getLogger(__name__)
 QUOTA_FILE = os.path.join(CACHE_SETTINGS["CACHE_DIR"], "api_quota.json")
 DAILY_QUOTA = 1000000  # Gmail API default quota units per day
 QUOTA_WARNING_THRESHOLD = 0.8  # 80% of quota
+QUOTA_FLUSH_INTERVAL = 5  # Seconds between writes of the quota file
 
 class APIQuotaMonitor:
     """Monitor and track Gmail API usage to prevent quota limits."""
@@ -24,6 +29,11 @@ class APIQuotaMonitor:
         """Initialize the quota monitor."""
         os.makedirs(CACHE_SETTINGS["CACHE_DIR"], exist_ok=True)
         self.quota_data = self._load_quota_data()
+        self._dirty = False
+        self._last_flush = time.time()
+        # Batch helpers record calls from their worker threads
+        self._lock = threading.RLock()
+        atexit.register(self._flush_if_dirty)
         
     def _load_quota_data(self):
         """Load quota data from file or initialize if not exists."""
@@ -35,9 +45,12 @@ class APIQuotaMonitor:
                     if data.get('date') != datetime.now().strftime('%Y-%m-%d'):
                         # Reset for new day
                         return self._initialize_quota_data()
+                    # Migrate files written with hour-string keys
+                    if isinstance(data.get('hourly_usage'), dict):
+                        data['hourly_usage'] = [int(data['hourly_usage'].get(str(i), 0)) for i in range(24)]
                     return data
             except Exception as e:
-                logger.error(f"Error loading quota data: {e}")
+                logger.error("Error loading quota data: %s", e)
                 return self._initialize_quota_data()
         else:
             return self._initialize_quota_data()
@@ -49,19 +62,38 @@ class APIQuotaMonitor:
             'total_calls': 0,
             'quota_used': 0,
             'calls_by_type': {},
-            'hourly_usage': {str(i): 0 for i in range(24)},
+            'hourly_usage': [0] * 24,
             'errors': 0
         }
         self._save_quota_data(data)
         return data
     
     def _save_quota_data(self, data):
-        """Save quota data to file."""
+        """Save quota data to file atomically."""
         try:
-            with open(QUOTA_FILE, 'w') as f:
-                json.dump(data, f, indent=2)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(QUOTA_FILE), suffix=".tmp")
+            with os.fdopen(fd, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, QUOTA_FILE)
         except Exception as e:
-            logger.error(f"Error saving quota data: {e}")
+            logger.error("Error saving quota data: %s", e)
+    
+    def _flush_if_dirty(self):
+        """Write pending quota changes to disk."""
+        with self._lock:
+            if self._dirty:
+                self._dirty = False
+                self._last_flush = time.time()
+                self._save_quota_data(self.quota_data)
+    
+    def acquire(self, quota_cost=1):
+        """
+        Wait until quota_cost units fit in the per-second quota.
+        
+        Uses the token bucket shared with the batch helpers, so callers only
+        sleep when the bucket is actually empty.
+        """
+        get_rate_limiter().acquire(quota_cost)
     
     def record_api_call(self, call_type, quota_cost=1, success=True):
         """
@@ -72,30 +104,33 @@ class APIQuotaMonitor:
             quota_cost (int): Quota units used by this call
             success (bool): Whether the call was successful
         """
-        current_hour = datetime.now().hour
+        with self._lock:
+            current_hour = datetime.now().hour
         
-        # Update call counts
-        self.quota_data['total_calls'] += 1
-        self.quota_data['quota_used'] += quota_cost
+            # Update call counts
+            self.quota_data['total_calls'] += 1
+            self.quota_data['quota_used'] += quota_cost
         
-        # Update call type stats
-        if call_type not in self.quota_data['calls_by_type']:
-            self.quota_data['calls_by_type'][call_type] = {
-                'count': 0,
-                'quota_used': 0
-            }
-        self.quota_data['calls_by_type'][call_type]['count'] += 1
-        self.quota_data['calls_by_type'][call_type]['quota_used'] += quota_cost
+            # Update call type stats
+            if call_type not in self.quota_data['calls_by_type']:
+                self.quota_data['calls_by_type'][call_type] = {
+                    'count': 0,
+                    'quota_used': 0
+                }
+            self.quota_data['calls_by_type'][call_type]['count'] += 1
+            self.quota_data['calls_by_type'][call_type]['quota_used'] += quota_cost
         
-        # Update hourly usage
-        self.quota_data['hourly_usage'][str(current_hour)] += quota_cost
+            # Update hourly usage
+            self.quota_data['hourly_usage'][current_hour] += quota_cost
         
-        # Update error count if needed
-        if not success:
-            self.quota_data['errors'] += 1
+            # Update error count if needed
+            if not success:
+                self.quota_data['errors'] += 1
         
-        # Save updated data
-        self._save_quota_data(self.quota_data)
+            # Save updated data at most every QUOTA_FLUSH_INTERVAL seconds
+            self._dirty = True
+            if time.time() - self._last_flush > QUOTA_FLUSH_INTERVAL:
+                self._flush_if_dirty()
         
         # Check if approaching quota limit
         self._check_quota_warning()
@@ -105,8 +140,8 @@ class APIQuotaMonitor:
         quota_percentage = self.quota_data['quota_used'] / DAILY_QUOTA
         if quota_percentage >= QUOTA_WARNING_THRESHOLD:
             logger.warning(
-                f"API QUOTA WARNING: {quota_percentage:.1%} of daily quota used "
-                f"({self.quota_data['quota_used']} / {DAILY_QUOTA})"
+                "API QUOTA WARNING: %.1f%% of daily quota used (%s / %s)",
+                quota_percentage * 100, self.quota_data['quota_used'], DAILY_QUOTA
             )
     
     def get_usage_stats(self):
@@ -124,37 +159,46 @@ class APIQuotaMonitor:
             'errors': self.quota_data['errors']
         }
     
+    def near_daily_quota(self):
+        """Return True once over 90% of the daily quota is used."""
+        return (self.quota_data['quota_used'] / DAILY_QUOTA) > 0.9
+    
     def should_throttle(self):
         """
         Determine if API calls should be throttled based on usage patterns.
         Returns True if throttling is recommended.
         """
         # Check if we're over 90% of quota
-        if (self.quota_data['quota_used'] / DAILY_QUOTA) > 0.9:
+        if self.near_daily_quota():
             return True
             
         # Check if current hour usage is high
-        current_hour = str(datetime.now().hour)
-        hourly_avg = sum(int(v) for v in self.quota_data['hourly_usage'].values()) / 24
-        if int(self.quota_data['hourly_usage'][current_hour]) > hourly_avg * 2:
+        hourly_usage = self.quota_data['hourly_usage']
+        hourly_avg = sum(hourly_usage) / 24
+        if hourly_usage[datetime.now().hour] > hourly_avg * 2:
             return True
             
         return False
 
-# Singleton instance
+# Singleton instance shared by every thread in the process
 _quota_monitor = None
+_quota_monitor_lock = threading.Lock()
 
 def get_quota_monitor():
     """Get the singleton quota monitor instance."""
     global _quota_monitor
-    if _quota_monitor is None:
-        _quota_monitor = APIQuotaMonitor()
+    with _quota_monitor_lock:
+        if _quota_monitor is None:
+            _quota_monitor = APIQuotaMonitor()
     return _quota_monitor
 
 def track_api_call(call_type, quota_cost=1):
     """
     Decorator to track API calls and their quota usage.
     
+    Only records the call. Quota tokens are taken from the shared bucket
+    at each Gmail request inside it, so they are not counted twice.
+    
     Args:
         call_type (str): Type of API call
         quota_cost (int): Quota units used by this call
@@ -170,18 +214,12 @@ def track_api_call(call_type, quota_cost=1):
                 return result
             except Exception as e:
                 success = False
-                logger.error(f"API call failed: {call_type} - {e}")
+                logger.error("API call failed: %s - %s", call_type, e)
                 raise
             finally:
                 elapsed = time.time() - start_time
                 monitor.record_api_call(call_type, quota_cost, success)
-                logger.debug(f"API call: {call_type} - Time: {elapsed:.2f}s - Quota: {quota_cost}")
-                
-                # Add throttling if needed
-                if monitor.should_throttle():
-                    delay = API_SETTINGS["API_CALL_DELAY"] * 2
-                    logger.info(f"Throttling API calls. Adding delay: {delay}s")
-                    time.sleep(delay)
+                logger.debug("API call: %s - Time: %.2fs - Quota: %s", call_type, elapsed, quota_cost)
                 
         return wrapper
     return decorator
\ No newline at end of file
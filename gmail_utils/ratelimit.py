@@ -0,0 +1,109 @@
+"""
+Token bucket rate limiting for the Gmail API per-user quota, and a
+sliding-window limiter for per-minute request quotas.
+"""
+
+import threading
+import time
+from collections import deque
+from config.settings import API_SETTINGS
+
+# Gmail quota units charged per request (batched requests pay per member)
+QUOTA_COSTS = {
+    "get": 5,
+    "list": 5,
+    "history.list": 2,
+    "getProfile": 1,
+    "attachments.get": 5,
+    "modify": 5,
+    "trash": 5,
+    "delete": 10,
+    "batchModify": 50,
+    "batchDelete": 50,
+    "drafts.create": 10,
+}
+
+class TokenBucket:
+    """Thread-safe token bucket, blocking callers only when the bucket is empty."""
+
+    def __init__(self, capacity, refill_per_sec):
+        """
+        Initialize the bucket full.
+
+        Args:
+            capacity (float): Maximum burst size in tokens
+            refill_per_sec (float): Tokens added back per second
+        """
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self._tokens = capacity
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.refill_per_sec)
+        self._last_refill = now
+
+    def acquire(self, cost):
+        """
+        Take cost tokens, sleeping until enough have been refilled.
+
+        Costs larger than the capacity are let through once the bucket is
+        full and leave it in debt, so later callers wait for the overdraft.
+        """
+        while True:
+            with self._lock:
+                self._refill()
+                needed = min(cost, self.capacity)
+                if self._tokens >= needed:
+                    self._tokens -= cost
+                    return
+                wait = (needed - self._tokens) / self.refill_per_sec
+            time.sleep(wait)
+
+class SlidingWindowLimiter:
+    """Thread-safe limiter allowing at most max_calls calls in any period seconds."""
+
+    def __init__(self, max_calls, period):
+        """
+        Args:
+            max_calls (int): Calls allowed per window
+            period (float): Window length in seconds
+        """
+        self.max_calls = max_calls
+        self.period = period
+        self._calls = deque()
+        self._lock = threading.Lock()
+
+    def acquire(self, cost=1):
+        """
+        Record cost calls, sleeping until they fit in the window.
+
+        Calls go out together while the window has room, unlike a
+        single-token bucket that spaces every call period / max_calls apart.
+        """
+        for _ in range(cost):
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    while self._calls and now - self._calls[0] >= self.period:
+                        self._calls.popleft()
+                    if len(self._calls) < self.max_calls:
+                        self._calls.append(now)
+                        break
+                    wait = self.period - (now - self._calls[0])
+                time.sleep(wait)
+
+# Singleton instance shared by every thread in the process
+_rate_limiter = None
+_rate_limiter_lock = threading.Lock()
+
+def get_rate_limiter():
+    """Get the singleton Gmail quota token bucket."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            quota = API_SETTINGS["QUOTA_UNITS_PER_SECOND"]
+            _rate_limiter = TokenBucket(capacity=quota, refill_per_sec=quota)
+    return _rate_limiter
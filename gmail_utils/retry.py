@@ -2,29 +2,96 @@
 Retry and error handling utilities for Gmail API operations.
 """
 
+import atexit
 import time
 import logging
+import logging.handlers
 import functools
+import queue
 import random
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
 from googleapiclient.errors import HttpError
 from config.settings import API_SETTINGS
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("gmail_automation.log"),
-        logging.StreamHandler()
-    ]
-)
 logger = logging.getLogger(__name__)
 
+_log_listener = None
+
+def configure_logging(level=logging.INFO, log_file="gmail_automation.log"):
+    """
+    Send log records to gmail_automation.log and the console.
+
+    Records are put on an in-memory queue and written by a background
+    listener thread, so logging never blocks API calls on disk I/O. Call once
+    from the application entrypoint; later calls do nothing.
+    """
+    global _log_listener
+    if _log_listener is not None:
+        return
+
+    formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    handlers = [logging.FileHandler(log_file), logging.StreamHandler()]
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+
+# Private generator for backoff jitter, separate from the global random state
+_rng = random.Random()
+
+# base ** attempt for the default base, up to the configured retry count
+_BACKOFF_TABLE = [API_SETTINGS["BACKOFF_BASE"] ** i for i in range(API_SETTINGS["MAX_RETRIES"] + 2)]
+
+# Batch member statuses worth re-sending (rate limit / transient server errors)
+RETRYABLE_STATUSES = (429, 500, 503)
+
+# Callbacks run when a call fails with 401, e.g. to drop cached services
+_auth_failure_hooks = []
+
+def on_auth_failure(callback):
+    """Register a callback to run before retrying a call that failed with 401."""
+    _auth_failure_hooks.append(callback)
+    return callback
+
 def exponential_backoff(attempt, base=API_SETTINGS["BACKOFF_BASE"]):
     """Calculate exponential backoff time with jitter."""
-    delay = base ** attempt + random.uniform(0, 1)
+    if base == API_SETTINGS["BACKOFF_BASE"] and attempt < len(_BACKOFF_TABLE):
+        return _BACKOFF_TABLE[attempt] + _rng.random()
+    delay = base ** attempt + _rng.random()
     return delay
 
+def retry_after_seconds(error):
+    """
+    Get the delay requested by the server's Retry-After header, if any.
+    
+    Args:
+        error (HttpError): The failed API response
+        
+    Returns:
+        float or None: Seconds to wait, or None if the header is absent/invalid
+    """
+    value = getattr(error, "resp", None) and error.resp.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    # Retry-After may also be an HTTP date
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
 def retry_on_api_error(max_retries=API_SETTINGS["MAX_RETRIES"]):
     """Decorator to retry functions on API errors with exponential backoff."""
     def decorator(func):
@@ -34,33 +101,44 @@ def retry_on_api_error(max_retries=API_SETTINGS["MAX_RETRIES"]):
                 try:
                     return func(*args, **kwargs)
                 except HttpError as e:
-                    if e.resp.status in (403, 429):  # Rate limit or quota exceeded
+                    if e.resp.status == 401:  # Stale credentials
+                        if attempt < max_retries:
+                            logger.warning(
+                                "Authentication error. Reloading credentials and retrying. "
+                                "Attempt %d/%d", attempt + 1, max_retries
+                            )
+                            for hook in _auth_failure_hooks:
+                                hook()
+                        else:
+                            logger.error("Max retries exceeded for API call: %s", func.__name__)
+                            raise
+                    elif e.resp.status in (403, 429):  # Rate limit or quota exceeded
                         if attempt < max_retries:
                             delay = exponential_backoff(attempt)
                             logger.warning(
-                                f"Rate limit hit. Retrying in {delay:.2f} seconds. "
-                                f"Attempt {attempt + 1}/{max_retries}"
+                                "Rate limit hit. Retrying in %.2f seconds. "
+                                "Attempt %d/%d", delay, attempt + 1, max_retries
                             )
                             time.sleep(delay)
                         else:
-                            logger.error(f"Max retries exceeded for API call: {func.__name__}")
+                            logger.error("Max retries exceeded for API call: %s", func.__name__)
                             raise
                     elif e.resp.status >= 500:  # Server error
                         if attempt < max_retries:
                             delay = exponential_backoff(attempt)
                             logger.warning(
-                                f"Server error. Retrying in {delay:.2f} seconds. "
-                                f"Attempt {attempt + 1}/{max_retries}"
+                                "Server error. Retrying in %.2f seconds. "
+                                "Attempt %d/%d", delay, attempt + 1, max_retries
                             )
                             time.sleep(delay)
                         else:
-                            logger.error(f"Max retries exceeded for API call: {func.__name__}")
+                            logger.error("Max retries exceeded for API call: %s", func.__name__)
                             raise
                     else:  # Other errors
-                        logger.error(f"API error in {func.__name__}: {e}")
+                        logger.error("API error in %s: %s", func.__name__, e)
                         raise
                 except Exception as e:
-                    logger.error(f"Unexpected error in {func.__name__}: {e}")
+                    logger.error("Unexpected error in %s: %s", func.__name__, e)
                     raise
         return wrapper
     return decorator
@@ -74,22 +152,22 @@ def safe_api_call(func):
         except HttpError as e:
             status = e.resp.status
             if status == 400:
-                logger.error(f"Bad request: {e}")
+                logger.error("Bad request: %s", e)
             elif status == 401:
-                logger.error(f"Authentication error: {e}")
+                logger.error("Authentication error: %s", e)
             elif status == 403:
-                logger.error(f"Forbidden. Quota exceeded or insufficient permissions: {e}")
+                logger.error("Forbidden. Quota exceeded or insufficient permissions: %s", e)
             elif status == 404:
-                logger.error(f"Resource not found: {e}")
+                logger.error("Resource not found: %s", e)
             elif status == 429:
-                logger.error(f"Rate limit exceeded: {e}")
+                logger.error("Rate limit exceeded: %s", e)
             elif status >= 500:
-                logger.error(f"Server error: {e}")
+                logger.error("Server error: %s", e)
             else:
-                logger.error(f"API error: {e}")
+                logger.error("API error: %s", e)
             return None
         except Exception as e:
-            logger.error(f"Unexpected error in {func.__name__}: {e}")
+            logger.error("Unexpected error in %s: %s", func.__name__, e)
             return None
     return wrapper
 
@@ -102,9 +180,6 @@ def track_api_usage(func):
         elapsed_time = time.time() - start_time
         
         # Log API call details
-        logger.info(
-            f"API Call: {func.__name__} - "
-            f"Duration: {elapsed_time:.2f}s"
-        )
+        logger.debug("API Call: %s - Duration: %.2fs", func.__name__, elapsed_time)
         return result
     return wrapper
\ No newline at end of file
@@ -0,0 +1,162 @@
+import os
+import io
+import json
+import time
+from llm_utils.classifier import client, CLASSIFICATION_MODEL, categorization_messages
+from llm_utils.cache import get_classification_cache
+from config.settings import CACHE_SETTINGS
+
+BATCH_INPUT_FILE = os.path.join(CACHE_SETTINGS["CACHE_DIR"], "batchinput.jsonl")
+PENDING_BATCH_FILE = os.path.join(CACHE_SETTINGS["CACHE_DIR"], "pending_batch.json")
+
+# Batch statuses that will never produce results
+FAILED_STATUSES = ("failed", "expired", "cancelled")
+
+# Fields kept from each email so labels can be applied once results arrive
+EMAIL_FIELDS = ("id", "subject", "body", "internalDate")
+
+
+def has_pending_batch():
+    """Check whether a submitted batch is still waiting to be collected."""
+    return os.path.exists(PENDING_BATCH_FILE)
+
+
+def _save_pending_batch(batch_id, emails):
+    os.makedirs(os.path.dirname(PENDING_BATCH_FILE), exist_ok=True)
+    pending = {
+        "batch_id": batch_id,
+        "submitted_at": time.time(),
+        "emails": [{field: email[field] for field in EMAIL_FIELDS if field in email} for email in emails],
+    }
+    with open(PENDING_BATCH_FILE, "w") as f:
+        json.dump(pending, f)
+
+
+def _load_pending_batch():
+    try:
+        with open(PENDING_BATCH_FILE, "r") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Error reading pending batch: {e}")
+        return None
+
+
+def _clear_pending_batch():
+    try:
+        os.remove(PENDING_BATCH_FILE)
+    except OSError:
+        pass
+
+
+def submit_classification_batch(emails):
+    """
+    Submit emails for categorization through the OpenAI Batch API.
+
+    One request per email is written to batchinput.jsonl, keyed by email ID
+    (custom_id), uploaded and submitted. The batch ID is persisted to
+    cache/pending_batch.json so a later run can collect the results.
+
+    Args:
+        emails (list): Email dicts with id, subject and body
+
+    Returns:
+        str: Batch ID, or None if nothing was submitted
+    """
+    if not emails:
+        return None
+
+    os.makedirs(os.path.dirname(BATCH_INPUT_FILE), exist_ok=True)
+    with open(BATCH_INPUT_FILE, "w") as f:
+        for email in emails:
+            request = {
+                "custom_id": email["id"],
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": {
+                    "model": CLASSIFICATION_MODEL,
+                    "messages": categorization_messages(email["subject"], email["body"]),
+                    "temperature": 0.0,
+                },
+            }
+            f.write(json.dumps(request) + "\n")
+
+    try:
+        with open(BATCH_INPUT_FILE, "rb") as f:
+            batch_input = client.files.create(file=f, purpose="batch")
+        batch = client.batches.create(
+            input_file_id=batch_input.id,
+            endpoint="/v1/chat/completions",
+            completion_window="24h",
+        )
+    except Exception as e:
+        print(f"⚠️ Error submitting classification batch: {e}")
+        return None
+
+    _save_pending_batch(batch.id, emails)
+    print(f"📦 Submitted {len(emails)} emails for batch classification ({batch.id})")
+    return batch.id
+
+
+def collect_classification_batch():
+    """
+    Collect the results of the pending classification batch, if finished.
+
+    Results are joined back to the submitted emails by custom_id and added
+    to the classification cache.
+
+    Returns:
+        list: Email dicts with a "category" key. Empty while the batch is
+        still running or when there is no pending batch.
+    """
+    if not has_pending_batch():
+        return []
+
+    pending = _load_pending_batch()
+    if not pending:
+        _clear_pending_batch()
+        return []
+
+    try:
+        batch = client.batches.retrieve(pending["batch_id"])
+    except Exception as e:
+        print(f"⚠️ Error retrieving classification batch: {e}")
+        return []
+
+    if batch.status in FAILED_STATUSES:
+        print(f"⚠️ Classification batch {batch.id} {batch.status}, discarding")
+        _clear_pending_batch()
+        return []
+
+    if batch.status != "completed":
+        print(f"⏳ Classification batch {batch.id} is {batch.status}")
+        return []
+
+    categories = {}
+    if batch.output_file_id:
+        try:
+            output = client.files.content(batch.output_file_id).text
+        except Exception as e:
+            print(f"⚠️ Error downloading classification batch results: {e}")
+            return []
+
+        for line in io.StringIO(output):
+            if not line.strip():
+                continue
+            result = json.loads(line)
+            response = result.get("response") or {}
+            if result.get("error") or response.get("status_code") != 200:
+                continue
+            categories[result["custom_id"]] = response["body"]["choices"][0]["message"]["content"].strip()
+
+    cache = get_classification_cache()
+    classified = []
+    for email in pending["emails"]:
+        category = categories.get(email["id"])
+        if category is None:
+            continue
+        cache.cache_classification(email["body"], email["subject"], category, confidence=0.9)
+        classified.append({**email, "category": category})
+
+    _clear_pending_batch()
+    print(f"📦 Collected {len(classified)} batch classifications ({batch.id})")
+    return classified
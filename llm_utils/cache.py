@@ -6,19 +6,52 @@ redundant LLM API calls by checking content similarity against previously
 classified emails.
 """
 
+import atexit
 import json
 import os
+import pickle
 import time
 import hashlib
 import re
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Optional, Tuple
 from datetime import datetime, timedelta
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.feature_extraction.text import HashingVectorizer
+from scipy import sparse
 import numpy as np
 
+try:
+    import xxhash
+except Exception:
+    xxhash = None
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+try:
+    from datasketch import MinHash, MinHashLSH
+except Exception:
+    MinHash = MinHashLSH = None
+
 from config.settings import CLASSIFICATION_CACHE_SETTINGS
 
+_WHITESPACE_RE = re.compile(r'\s+')
+_SPECIAL_CHARS_RE = re.compile(r'[^\w\s]')
+
+# Hex digest length of _generate_content_hash (xxh3_64 or md5 fallback)
+CONTENT_HASH_LENGTH = 16 if xxhash else 32
+
+
+def _dumps(obj) -> bytes:
+    return orjson.dumps(obj) if orjson else json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+
+def _loads(data):
+    return orjson.loads(data) if orjson else json.loads(data)
+
 
 class ClassificationCache:
     """
@@ -33,50 +66,231 @@ class ClassificationCache:
         self.enabled = CLASSIFICATION_CACHE_SETTINGS["ENABLED"]
         self.min_content_length = CLASSIFICATION_CACHE_SETTINGS["MIN_CONTENT_LENGTH"]
         self.max_content_length = CLASSIFICATION_CACHE_SETTINGS["MAX_CONTENT_LENGTH"]
+        self.min_content_words = CLASSIFICATION_CACHE_SETTINGS["MIN_CONTENT_WORDS"]
         
         # Ensure cache directory exists
         os.makedirs(os.path.dirname(self.cache_file), exist_ok=True)
         
-        # Initialize TF-IDF vectorizer for similarity calculation
-        self.vectorizer = TfidfVectorizer(
-            max_features=1000,
+        # Stateless hashing vectorizer for similarity calculation, nothing to
+        # refit as entries come and go
+        self.vectorizer = HashingVectorizer(
+            n_features=2 ** 14,
             stop_words='english',
             ngram_range=(1, 2),
-            lowercase=True
+            lowercase=True,
+            alternate_sign=False,
+            norm='l2',
+            dtype=np.float32
         )
         
+        # Vectors of the cached entries and the content_hash of each row
+        self._cache_matrix = None
+        self._row_hashes = []
+        self._row_index = {}
+        
+        # MinHash LSH narrows similarity search to likely near-duplicates
+        self.lsh_threshold = CLASSIFICATION_CACHE_SETTINGS["LSH_THRESHOLD"]
+        self.lsh_num_perm = CLASSIFICATION_CACHE_SETTINGS["LSH_NUM_PERM"]
+        self._lsh = None
+        
+        # Matrix, row hashes and LSH index saved next to the log so the next
+        # run only vectorizes entries added since
+        base_path = os.path.splitext(self.cache_file)[0]
+        self.index_files = {
+            "meta": f"{base_path}.index.json",
+            "matrix": f"{base_path}.matrix.npz",
+            "lsh": f"{base_path}.lsh.pkl",
+        }
+        self._index_dirty = False
+        
+        # Serializes lookups and updates from concurrently running workflows
+        self._lock = threading.RLock()
+        
         self._cache_data = self._load_cache()
-        self._update_vectorizer()
+        self._build_matrix()
+        atexit.register(self._save_index)
+    
+    def _read_log(self, entries: OrderedDict) -> int:
+        """
+        Replay the JSONL log into entries. Returns the number of lines read.
+        
+        Every insert and cache hit appends the entry as one line, so the last
+        line for a content_hash wins and the order of those last lines is the
+        LRU order.
+        """
+        lines = 0
+        with open(self.cache_file, 'rb') as f:
+            for line in f:
+                lines += 1
+                try:
+                    entry = _loads(line)
+                    content_hash = entry["content_hash"]
+                except (ValueError, KeyError, TypeError):
+                    continue  # e.g. a line cut short by a crash
+                entries.pop(content_hash, None)
+                entries[content_hash] = entry
+        return lines
+    
+    def _read_legacy_cache(self, entries: OrderedDict):
+        """Read entries from the JSON file used before the JSONL log."""
+        legacy_file = os.path.splitext(self.cache_file)[0] + ".json"
+        try:
+            with open(legacy_file, 'rb') as f:
+                data = _loads(f.read())
+        except (OSError, ValueError):
+            return False
+        for entry in sorted(data.get("classifications", []), key=lambda x: x.get("timestamp", 0)):
+            if "content_hash" in entry:
+                entries[entry["content_hash"]] = entry
+        return True
     
     def _load_cache(self) -> Dict:
-        """Load cache data from file."""
-        if not os.path.exists(self.cache_file):
-            return {"classifications": [], "last_updated": time.time()}
+        """
+        Load cache data from file.
+        
+        Classifications are kept in an OrderedDict keyed by content_hash,
+        least recently used first.
+        """
+        entries = OrderedDict()
+        self._log_lines = 0
+        compact = False
+        try:
+            self._log_lines = self._read_log(entries)
+        except FileNotFoundError:
+            compact = self._read_legacy_cache(entries)
+        except OSError as e:
+            print(f"Warning: Failed to read classification cache: {e}")
         
+        # Rehash entries written with the other hash function
+        for content_hash, entry in list(entries.items()):
+            if len(content_hash) != CONTENT_HASH_LENGTH:
+                del entries[content_hash]
+                entry["content_hash"] = self._generate_content_hash(entry["content"])
+                entries[entry["content_hash"]] = entry
+                compact = True
+        
+        # Evicted entries are still in the log, keep the most recent ones
+        while len(entries) > self.max_cache_size:
+            entries.popitem(last=False)
+        
+        try:
+            last_updated = os.path.getmtime(self.cache_file)
+        except OSError:
+            last_updated = time.time()
+        
+        data = {"classifications": entries, "last_updated": last_updated}
+        # Clean expired entries
+        self._clean_expired_entries(data)
+        if compact or self._log_lines > 1.5 * self.max_cache_size:
+            self._compact(data)
+        return data
+    
+    def _compact(self, data: Optional[Dict] = None):
+        """Rewrite the log with one line per current entry."""
+        data = data or self._cache_data
+        entries = data["classifications"].values()
+        temp_file = f"{self.cache_file}.tmp"
+        try:
+            with open(temp_file, 'wb') as f:
+                for entry in entries:
+                    f.write(_dumps(entry) + b"\n")
+            os.replace(temp_file, self.cache_file)
+            self._log_lines = len(data["classifications"])
+        except Exception as e:
+            print(f"Warning: Failed to save classification cache: {e}")
+        self._save_index()
+    
+    def _index_meta(self) -> Dict:
+        """Settings the saved index was built with; it is only reused if they still match."""
+        return {
+            "n_features": self.vectorizer.n_features,
+            "dtype": np.dtype(self.vectorizer.dtype).name,
+            "lsh": [self.lsh_threshold, self.lsh_num_perm] if MinHashLSH else None,
+        }
+    
+    def _save_index(self):
+        """Save the cache matrix, its row hashes and the LSH index if they changed."""
+        with self._lock:
+            if not self._index_dirty or self._cache_matrix is None:
+                return
+            
+            try:
+                # The meta file is written last and marks the other files as valid
+                if os.path.exists(self.index_files["meta"]):
+                    os.remove(self.index_files["meta"])
+                sparse.save_npz(self.index_files["matrix"], self._cache_matrix)
+                if self._lsh is not None:
+                    with open(self.index_files["lsh"], 'wb') as f:
+                        pickle.dump(self._lsh, f, protocol=pickle.HIGHEST_PROTOCOL)
+                with open(self.index_files["meta"], 'wb') as f:
+                    f.write(_dumps({**self._index_meta(), "row_hashes": self._row_hashes}))
+                self._index_dirty = False
+            except Exception as e:
+                print(f"Warning: Failed to save classification cache index: {e}")
+    
+    def _load_index(self) -> Tuple[Optional[sparse.csr_matrix], List[str], Optional[object]]:
+        """Load the index saved by a previous run. Returns (matrix, row_hashes, lsh)."""
         try:
-            with open(self.cache_file, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                # Clean expired entries
-                self._clean_expired_entries(data)
-                return data
-        except (json.JSONDecodeError, FileNotFoundError):
-            return {"classifications": [], "last_updated": time.time()}
+            with open(self.index_files["meta"], 'rb') as f:
+                meta = _loads(f.read())
+            row_hashes = meta.pop("row_hashes")
+            if meta != self._index_meta():
+                return None, [], None
+            
+            matrix = sparse.load_npz(self.index_files["matrix"]).tocsr()
+            if matrix.shape[0] != len(row_hashes):
+                return None, [], None
+            
+            lsh = None
+            if MinHashLSH:
+                with open(self.index_files["lsh"], 'rb') as f:
+                    lsh = pickle.load(f)
+            return matrix, row_hashes, lsh
+        except FileNotFoundError:
+            return None, [], None
+        except Exception as e:
+            print(f"Warning: Failed to load classification cache index: {e}")
+            return None, [], None
     
-    def _save_cache(self):
-        """Save cache data to file."""
+    def _append_entry(self, entry: Dict):
+        """Append one entry to the log, compacting it once it has grown too long."""
         try:
-            with open(self.cache_file, 'w', encoding='utf-8') as f:
-                json.dump(self._cache_data, f, indent=2, ensure_ascii=False)
+            with open(self.cache_file, 'ab') as f:
+                f.write(_dumps(entry) + b"\n")
+            self._log_lines += 1
         except Exception as e:
             print(f"Warning: Failed to save classification cache: {e}")
+            return
+        
+        if self._log_lines > 1.5 * self.max_cache_size:
+            self._compact()
     
-    def _clean_expired_entries(self, data: Dict):
-        """Remove expired cache entries."""
+    def _clean_expired_entries(self, data: Dict) -> List[str]:
+        """Remove expired cache entries. Returns the hashes that were removed."""
         current_time = time.time()
-        data["classifications"] = [
-            entry for entry in data["classifications"]
-            if current_time - entry.get("timestamp", 0) < self.cache_ttl
-        ]
+        entries = data["classifications"]
+        expired = []
+        # Entries are in timestamp order, so expired ones are at the front
+        while entries:
+            content_hash, entry = next(iter(entries.items()))
+            if current_time - entry.get("timestamp", 0) < self.cache_ttl:
+                break
+            entries.popitem(last=False)
+            expired.append(content_hash)
+        return expired
+    
+    def _evict_expired(self):
+        """Drop entries whose TTL ran out while the process was running."""
+        expired = self._clean_expired_entries(self._cache_data)
+        if expired:
+            self._remove_from_matrix(expired)
+    
+    def _touch(self, entry: Dict):
+        """Reset an entry's TTL and mark it most recently used after a cache hit."""
+        entry["timestamp"] = time.time()
+        self._cache_data["classifications"].move_to_end(entry["content_hash"])
+        self._cache_data["last_updated"] = entry["timestamp"]
+        self._append_entry(entry)
     
     def _preprocess_content(self, content: str) -> str:
         """Preprocess email content for similarity comparison."""
@@ -88,59 +302,126 @@ class ClassificationCache:
             content = content[:self.max_content_length]
         
         # Clean and normalize text
-        content = re.sub(r'\s+', ' ', content)  # Normalize whitespace
-        content = re.sub(r'[^\w\s]', ' ', content)  # Remove special characters
+        content = _WHITESPACE_RE.sub(' ', content)  # Normalize whitespace
+        content = _SPECIAL_CHARS_RE.sub(' ', content)  # Remove special characters
         content = content.lower().strip()
         
         return content
     
-    def _update_vectorizer(self):
-        """Update TF-IDF vectorizer with current cache content."""
-        if not self._cache_data["classifications"]:
-            return
+    def _too_short(self, processed_content: str) -> bool:
+        """Check if too little text is left after preprocessing for a meaningful match."""
+        return (len(processed_content) < self.min_content_length
+                or len(processed_content.split()) < self.min_content_words)
+    
+    def _minhash(self, processed_content: str):
+        """MinHash of the word 3-shingles of preprocessed content."""
+        words = processed_content.split()
+        shingles = {" ".join(words[i:i + 3]) for i in range(max(1, len(words) - 2))}
+        minhash = MinHash(num_perm=self.lsh_num_perm)
+        minhash.update_batch([shingle.encode('utf-8') for shingle in shingles])
+        return minhash
+    
+    def _build_matrix(self):
+        """
+        Vectorize every cached entry, one row per entry in their current order.
         
-        contents = [
-            self._preprocess_content(entry["content"])
-            for entry in self._cache_data["classifications"]
-        ]
+        Rows and LSH entries saved by the previous run are reused; only
+        entries added since are vectorized.
+        """
+        entries = self._cache_data["classifications"]
+        self._row_hashes = list(entries)
+        self._row_index = {content_hash: i for i, content_hash in enumerate(self._row_hashes)}
+        
+        saved_matrix, saved_hashes, saved_lsh = self._load_index()
+        if saved_matrix is None:
+            saved_matrix = sparse.csr_matrix((0, self.vectorizer.n_features), dtype=self.vectorizer.dtype)
+        saved_rows = {content_hash: i for i, content_hash in enumerate(saved_hashes)}
         
+        missing = [content_hash for content_hash in self._row_hashes if content_hash not in saved_rows]
+        contents = [self._preprocess_content(entries[content_hash]["content"]) for content_hash in missing]
         if contents:
-            try:
-                self.vectorizer.fit(contents)
-            except Exception as e:
-                print(f"Warning: Failed to update vectorizer: {e}")
+            new_rows = self.vectorizer.transform(contents)
+        else:
+            new_rows = sparse.csr_matrix((0, self.vectorizer.n_features), dtype=self.vectorizer.dtype)
+        
+        # Saved rows first, then new ones, reordered to match the entries
+        new_positions = {content_hash: len(saved_hashes) + i for i, content_hash in enumerate(missing)}
+        order = [saved_rows.get(content_hash, new_positions.get(content_hash)) for content_hash in self._row_hashes]
+        self._cache_matrix = sparse.vstack([saved_matrix, new_rows], format="csr")[order]
+        
+        if MinHashLSH:
+            if saved_lsh is None:
+                saved_lsh = MinHashLSH(threshold=self.lsh_threshold, num_perm=self.lsh_num_perm)
+            self._lsh = saved_lsh
+            for content_hash in saved_hashes:
+                if content_hash not in self._row_index:
+                    self._lsh.remove(content_hash)
+            with self._lsh.insertion_session() as session:
+                for content_hash, processed_content in zip(missing, contents):
+                    session.insert(content_hash, self._minhash(processed_content))
+        
+        self._index_dirty = self._row_hashes != saved_hashes
+    
+    def _add_to_matrix(self, content_hash: str, processed_content: str):
+        """Append the newest entry's row to the cache matrix and the LSH index."""
+        row = self.vectorizer.transform([processed_content])
+        self._cache_matrix = sparse.vstack([self._cache_matrix, row], format="csr")
+        self._row_index[content_hash] = len(self._row_hashes)
+        self._row_hashes.append(content_hash)
+        if self._lsh is not None:
+            self._lsh.insert(content_hash, self._minhash(processed_content))
+        self._index_dirty = True
+    
+    def _remove_from_matrix(self, content_hashes: List[str]):
+        """Drop the rows of removed entries from the cache matrix and the LSH index."""
+        removed = set(content_hashes)
+        keep = [i for i, content_hash in enumerate(self._row_hashes) if content_hash not in removed]
+        self._cache_matrix = self._cache_matrix[keep]
+        self._row_hashes = [self._row_hashes[i] for i in keep]
+        self._row_index = {content_hash: i for i, content_hash in enumerate(self._row_hashes)}
+        if self._lsh is not None:
+            for content_hash in removed:
+                self._lsh.remove(content_hash)
+        self._index_dirty = True
     
-    def _calculate_similarity(self, content1: str, content2: str) -> float:
-        """Calculate cosine similarity between two text contents."""
+    def _find_most_similar(self, processed_content: str) -> Tuple[float, Optional[Dict]]:
+        """Find the cached entry most similar to preprocessed content. Returns (similarity, entry)."""
+        entries = self._cache_data["classifications"]
+        if not entries or not processed_content:
+            return 0.0, None
+        
+        # Only score the LSH candidates when the index is available
+        rows = None
+        matrix = self._cache_matrix
+        if self._lsh is not None:
+            candidates = self._lsh.query(self._minhash(processed_content))
+            if not candidates:
+                return 0.0, None
+            rows = [self._row_index[content_hash] for content_hash in candidates]
+            matrix = self._cache_matrix[rows]
+        
+        # Rows are L2 normalized, so one sparse matrix-vector product gives
+        # every cosine similarity; a dense query takes scipy's csr_matvec path
         try:
-            processed_content1 = self._preprocess_content(content1)
-            processed_content2 = self._preprocess_content(content2)
-            
-            if not processed_content1 or not processed_content2:
-                return 0.0
-            
-            # Use existing vectorizer or create new one for comparison
-            try:
-                vectors = self.vectorizer.transform([processed_content1, processed_content2])
-                similarity = cosine_similarity(vectors[0:1], vectors[1:2])[0][0]
-                return float(similarity)
-            except:
-                # Fallback: create temporary vectorizer for this comparison
-                temp_vectorizer = TfidfVectorizer(
-                    max_features=500,
-                    stop_words='english',
-                    lowercase=True
-                )
-                vectors = temp_vectorizer.fit_transform([processed_content1, processed_content2])
-                similarity = cosine_similarity(vectors[0:1], vectors[1:2])[0][0]
-                return float(similarity)
+            query_vector = self.vectorizer.transform([processed_content]).toarray().ravel()
+            similarities = matrix.dot(query_vector)
         except Exception as e:
             print(f"Warning: Similarity calculation failed: {e}")
-            return 0.0
+            return 0.0, None
+        
+        best_index = int(similarities.argmax())
+        if rows is not None:
+            best_index = rows[best_index]
+        return float(similarities.max()), entries[self._row_hashes[best_index]]
     
     def _generate_content_hash(self, content: str) -> str:
         """Generate a hash for content to enable quick exact matches."""
-        processed_content = self._preprocess_content(content)
+        return self._hash_processed(self._preprocess_content(content))
+    
+    def _hash_processed(self, processed_content: str) -> str:
+        """Hash already preprocessed content."""
+        if xxhash:
+            return xxhash.xxh3_64_hexdigest(processed_content.encode('utf-8'))
         return hashlib.md5(processed_content.encode('utf-8')).hexdigest()
     
     def get_cached_classification(self, email_content: str, subject: str = "") -> Optional[Dict]:
@@ -161,41 +442,43 @@ class ClassificationCache:
         if len(email_content) < self.min_content_length:
             return None
         
-        # Combine subject and content for comparison
-        full_content = f"{subject} {email_content}".strip()
-        content_hash = self._generate_content_hash(full_content)
-        
-        # Check for exact match first (fastest)
-        for entry in self._cache_data["classifications"]:
-            if entry.get("content_hash") == content_hash:
+        with self._lock:
+            # Entries are only valid until their TTL runs out
+            self._evict_expired()
+            
+            # Combine subject and content for comparison, preprocessed once for
+            # both the hash and the vector
+            full_content = f"{subject} {email_content}".strip()
+            processed_content = self._preprocess_content(full_content)
+            if self._too_short(processed_content):
+                return None
+            content_hash = self._hash_processed(processed_content)
+            
+            # Check for exact match first (fastest)
+            entry = self._cache_data["classifications"].get(content_hash)
+            if entry is not None:
                 print(f"Cache hit: Exact match found for email")
+                self._touch(entry)
                 return {
                     "category": entry["category"],
                     "confidence": entry.get("confidence", 0.9),
                     "cache_type": "exact_match"
                 }
-        
-        # Check for similarity matches
-        best_similarity = 0.0
-        best_match = None
-        
-        for entry in self._cache_data["classifications"]:
-            similarity = self._calculate_similarity(full_content, entry["content"])
             
-            if similarity > best_similarity and similarity >= self.similarity_threshold:
-                best_similarity = similarity
-                best_match = entry
-        
-        if best_match:
-            print(f"Cache hit: Similar content found (similarity: {best_similarity:.3f})")
-            return {
-                "category": best_match["category"],
-                "confidence": best_match.get("confidence", 0.9) * best_similarity,
-                "cache_type": "similarity_match",
-                "similarity_score": best_similarity
-            }
-        
-        return None
+            # Check for similarity matches
+            best_similarity, best_match = self._find_most_similar(processed_content)
+            
+            if best_match and best_similarity >= self.similarity_threshold:
+                print(f"Cache hit: Similar content found (similarity: {best_similarity:.3f})")
+                self._touch(best_match)
+                return {
+                    "category": best_match["category"],
+                    "confidence": best_match.get("confidence", 0.9) * best_similarity,
+                    "cache_type": "similarity_match",
+                    "similarity_score": best_similarity
+                }
+            
+            return None
     
     def cache_classification(self, email_content: str, subject: str, category: str, confidence: float = 0.9):
         """
@@ -214,40 +497,46 @@ class ClassificationCache:
         if len(email_content) < self.min_content_length:
             return
         
-        full_content = f"{subject} {email_content}".strip()
-        content_hash = self._generate_content_hash(full_content)
-        
-        # Check if already cached (avoid duplicates)
-        for entry in self._cache_data["classifications"]:
-            if entry.get("content_hash") == content_hash:
+        with self._lock:
+            full_content = f"{subject} {email_content}".strip()
+            processed_content = self._preprocess_content(full_content)
+            if self._too_short(processed_content):
+                return  # Would never be looked up
+            content_hash = self._hash_processed(processed_content)
+            
+            entries = self._cache_data["classifications"]
+            
+            # Check if already cached (avoid duplicates)
+            if content_hash in entries:
                 return  # Already cached
-        
-        # Add new cache entry
-        cache_entry = {
-            "content": full_content,
-            "content_hash": content_hash,
-            "category": category,
-            "confidence": confidence,
-            "timestamp": time.time(),
-            "subject": subject
-        }
-        
-        self._cache_data["classifications"].append(cache_entry)
-        
-        # Maintain cache size limit
-        if len(self._cache_data["classifications"]) > self.max_cache_size:
-            # Remove oldest entries
-            self._cache_data["classifications"].sort(key=lambda x: x["timestamp"])
-            self._cache_data["classifications"] = self._cache_data["classifications"][-self.max_cache_size:]
-        
-        # Update vectorizer with new content
-        self._update_vectorizer()
-        
-        # Save to file
-        self._cache_data["last_updated"] = time.time()
-        self._save_cache()
-        
-        print(f"Cached classification: {category} (confidence: {confidence:.3f})")
+            
+            # Add new cache entry
+            cache_entry = {
+                "content": full_content,
+                "content_hash": content_hash,
+                "category": category,
+                "confidence": confidence,
+                "timestamp": time.time(),
+                "subject": subject
+            }
+            
+            entries[content_hash] = cache_entry
+            
+            # Update vectorizer with new content
+            self._add_to_matrix(content_hash, processed_content)
+            
+            # Maintain cache size limit by evicting the least recently used entries
+            evicted = []
+            while len(entries) > self.max_cache_size:
+                evicted.append(entries.popitem(last=False)[0])
+            if evicted:
+                self._remove_from_matrix(evicted)
+            
+            # Save to file
+            self._cache_data["last_updated"] = time.time()
+            self._append_entry(cache_entry)
+            
+            print(f"Cached classification: {category} (confidence: {confidence:.3f})")
     
     def get_cache_stats(self) -> Dict:
         """Get cache statistics."""
@@ -261,17 +550,21 @@ class ClassificationCache:
     
     def clear_cache(self):
         """Clear all cached classifications."""
-        self._cache_data = {"classifications": [], "last_updated": time.time()}
-        self._save_cache()
-        print("Classification cache cleared")
+        with self._lock:
+            self._cache_data = {"classifications": OrderedDict(), "last_updated": time.time()}
+            self._build_matrix()
+            self._compact()
+            print("Classification cache cleared")
 
 
 # Global cache instance
 _cache_instance = None
+_cache_instance_lock = threading.Lock()
 
 def get_classification_cache() -> ClassificationCache:
     """Get the global classification cache instance."""
     global _cache_instance
-    if _cache_instance is None:
-        _cache_instance = ClassificationCache()
+    with _cache_instance_lock:
+        if _cache_instance is None:
+            _cache_instance = ClassificationCache()
     return _cache_instance
\ No newline at end of file
@@ -1,11 +1,15 @@
 # In llm_utils/classifier.py
 
 import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from dotenv import load_dotenv
 # from groq import Groq
 from openai import OpenAI
-from llm_utils.summarizer import ai_summarize, summarize_email
+from llm_utils.summarizer import summarize_email, truncate_to_tokens
 from llm_utils.cache import get_classification_cache
+from gmail_utils.ratelimit import SlidingWindowLimiter
 from config.settings import LLM_SETTINGS
 
 load_dotenv()
@@ -17,54 +21,470 @@ client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
 CLASSIFICATION_MODEL = LLM_SETTINGS.get("CLASSIFICATION_MODEL", "gpt-4o-mini")
 RESPONSE_MODEL = LLM_SETTINGS.get("RESPONSE_MODEL", "gpt-4o-mini")
 
+CLASSIFICATION_BATCH_SIZE = LLM_SETTINGS["CLASSIFICATION_BATCH_SIZE"]
+CLASSIFICATION_WORKERS = LLM_SETTINGS["CLASSIFICATION_WORKERS"]
+CLASSIFICATION_BODY_TOKENS = LLM_SETTINGS["CLASSIFICATION_BODY_TOKENS"]
+RESPONSE_BODY_TOKENS = LLM_SETTINGS["RESPONSE_BODY_TOKENS"]
 
-def categorize_email(subject, body):
-    try:
-        # Check cache first
-        cache = get_classification_cache()
-        cached_result = cache.get_cached_classification(body, subject)
+# Every LLM request takes a slot, replacing fixed sleeps between emails.
+# Requests from the worker pools go out together until a 60 s window
+# holds REQUESTS_PER_MINUTE of them.
+_llm_rate_limiter = SlidingWindowLimiter(
+    max_calls=LLM_SETTINGS["REQUESTS_PER_MINUTE"],
+    period=60,
+)
+
+CATEGORIES = ("Important", "Promotions", "Updates", "Spam")
+REPLY_LABELS = ("Wanted Important", "Unwanted Important")
+# Final labels: Important split by whether a reply is needed
+FINAL_LABELS = REPLY_LABELS + ("Promotions", "Updates", "Spam")
+
+
+def _numbered_label_re(labels):
+    """Match "3: Promotions" style lines in a batched answer."""
+    alternatives = "|".join(re.escape(label).replace(r"\ ", r"\s+") for label in labels)
+    return re.compile(rf"^\W*(?:email\s*)?(\d+)\W+({alternatives})\b", re.IGNORECASE | re.MULTILINE)
+
+
+_NUMBERED_CATEGORY_RE = _numbered_label_re(CATEGORIES)
+_NUMBERED_REPLY_RE = _numbered_label_re(REPLY_LABELS)
+_NUMBERED_FINAL_RE = _numbered_label_re(FINAL_LABELS)
+
+REPLY_RULES = """
+        Here are the user's exact classification rules:
+
+        **1. Wanted Important:** This category is for any email which requires a direct, personal response.
+        **2. Unwanted Important:** This category is for emails that contain important information but DO NOT require a reply.
         
+        --- RULES & EXAMPLES ---
+        - Emails from recruiters asking for availability are 'Wanted Important'.
+        - Emails from colleagues asking for a file or your time are 'Wanted Important'.
+        - Security alerts, company newsletters, and order confirmations are 'Unwanted Important'.
+        ---
+"""
+
+# Keyword rules compiled once per category
+_KEYWORD_PATTERNS = {
+    category: re.compile("|".join(patterns), re.IGNORECASE)
+    for category, patterns in LLM_SETTINGS["KEYWORD_RULES"].items()
+}
+_REPLY_KEYWORD_PATTERNS = {
+    label: re.compile("|".join(patterns), re.IGNORECASE)
+    for label, patterns in LLM_SETTINGS["REPLY_KEYWORD_RULES"].items()
+}
+
+# LLM calls currently running, keyed by (subject, body), or by
+# ("classify", subject, body) for final labels
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+# Fixed instructions go in the system message so every request shares the
+# same prompt prefix and the provider's prompt caching can reuse it
+CATEGORIZATION_SYSTEM = """You are an email categorization engine. Your task is to classify emails into one of the following categories based on their content:
+- Important: Personal or work-related messages that seem to be from a real person and are not automated.
+- Promotions: Marketing emails, special offers, newsletters.
+- Updates: Notifications, shipping updates, social media alerts, forum digests.
+- Spam: Unsolicited junk mail.
+
+Only ever answer with the category names Important, Promotions, Updates or Spam."""
+
+REPLY_CHECK_SYSTEM = f"""You are a hyper-efficient executive assistant AI. Your sole purpose is to classify incoming emails based on a strict set of rules provided by your user to determine if a personal reply is mandatory.
+{REPLY_RULES}
+Analyze emails based ONLY on these rules, and only ever answer with the labels "Wanted Important" or "Unwanted Important"."""
+
+CLASSIFICATION_SYSTEM = f"""You are an email classification engine. Your task is to classify emails into one of the following labels based on their content:
+- Wanted Important: Personal or work-related messages from a real person that require a direct, personal response.
+- Unwanted Important: Personal or work-related messages that contain important information but DO NOT require a reply.
+- Promotions: Marketing emails, special offers, newsletters.
+- Updates: Notifications, shipping updates, social media alerts, forum digests.
+- Spam: Unsolicited junk mail.
+{REPLY_RULES}
+Only ever answer with the labels Wanted Important, Unwanted Important, Promotions, Updates or Spam."""
+
+RESPONSE_SYSTEM = """You are an AI assistant. Write a polite and concise response to the email you are given.
+Do not include signatures. Keep your response professional, friendly, and specific to any questions or requests."""
+
+LONG_EMAIL_INSTRUCTION = "This email is long. First work out its key actions, dates, amounts, and obligations, then reply to those."
+
+
+def _numbered_emails(subjects, bodies):
+    return "\n\n".join(
+        f"Email {number}:\nSubject: {subject}\nBody: {truncate_to_tokens(body, CLASSIFICATION_BODY_TOKENS)}"
+        for number, (subject, body) in enumerate(zip(subjects, bodies), 1)
+    )
+
+
+def categorization_messages(subject, body):
+    """Build the chat messages used to categorize an email."""
+    prompt_content = f"""Subject: {subject}
+Body: {truncate_to_tokens(body, CLASSIFICATION_BODY_TOKENS)}
+
+CRITICAL INSTRUCTION: Your entire response must be ONLY one of the following single words: Important, Promotions, Updates, Spam."""
+    return [
+        {"role": "system", "content": CATEGORIZATION_SYSTEM},
+        {"role": "user", "content": prompt_content},
+    ]
+
+
+def batch_categorization_messages(subjects, bodies):
+    """Build the chat messages used to categorize several emails in one request."""
+    prompt_content = f"""{_numbered_emails(subjects, bodies)}
+
+CRITICAL INSTRUCTION: Your entire response must be exactly {len(subjects)} lines, one per email in order, each formatted as "<email number>: <category>" where the category is ONLY one of the following single words: Important, Promotions, Updates, Spam."""
+    return [
+        {"role": "system", "content": CATEGORIZATION_SYSTEM},
+        {"role": "user", "content": prompt_content},
+    ]
+
+
+def reply_check_messages(subject, body):
+    """Build the chat messages used to check whether an email needs a reply."""
+    prompt_content = f"""Email to Classify:
+Subject: {subject}
+Body: {truncate_to_tokens(body, CLASSIFICATION_BODY_TOKENS)}
+
+CRITICAL INSTRUCTION: Your entire response must be ONLY the words "Wanted Important" or "Unwanted Important". Do not include any other text."""
+    return [
+        {"role": "system", "content": REPLY_CHECK_SYSTEM},
+        {"role": "user", "content": prompt_content},
+    ]
+
+
+def classification_messages(subject, body):
+    """Build the chat messages used to give an email its final label in one request."""
+    prompt_content = f"""Subject: {subject}
+Body: {truncate_to_tokens(body, CLASSIFICATION_BODY_TOKENS)}
+
+CRITICAL INSTRUCTION: Your entire response must be ONLY one of the following labels: Wanted Important, Unwanted Important, Promotions, Updates, Spam."""
+    return [
+        {"role": "system", "content": CLASSIFICATION_SYSTEM},
+        {"role": "user", "content": prompt_content},
+    ]
+
+
+def batch_classification_messages(subjects, bodies):
+    """Build the chat messages used to give several emails their final label in one request."""
+    prompt_content = f"""{_numbered_emails(subjects, bodies)}
+
+CRITICAL INSTRUCTION: Your entire response must be exactly {len(subjects)} lines, one per email in order, each formatted as "<email number>: <label>" where the label is ONLY one of the following: Wanted Important, Unwanted Important, Promotions, Updates, Spam."""
+    return [
+        {"role": "system", "content": CLASSIFICATION_SYSTEM},
+        {"role": "user", "content": prompt_content},
+    ]
+
+
+def batch_reply_check_messages(subjects, bodies):
+    """Build the chat messages used to check several emails for a needed reply in one request."""
+    prompt_content = f"""{_numbered_emails(subjects, bodies)}
+
+CRITICAL INSTRUCTION: Your entire response must be exactly {len(subjects)} lines, one per email in order, each formatted as "<email number>: <label>" where the label is ONLY the words "Wanted Important" or "Unwanted Important"."""
+    return [
+        {"role": "system", "content": REPLY_CHECK_SYSTEM},
+        {"role": "user", "content": prompt_content},
+    ]
+
+
+def _fast_classify(subject, body, patterns=_KEYWORD_PATTERNS):
+    """
+    Label an email from keyword rules alone.
+
+    Returns:
+        str: The label when exactly one label's rules match, else None
+    """
+    text = f"{subject}\n{body[:256]}"
+    matches = [label for label, pattern in patterns.items() if pattern.search(text)]
+    return matches[0] if len(matches) == 1 else None
+
+
+def _coalesced(key, call):
+    """
+    Run call() once for concurrent callers passing the same key.
+
+    The first caller makes the call; the others wait for its result (or
+    exception) instead of issuing duplicate LLM requests.
+    """
+    with _inflight_lock:
+        future = _inflight.get(key)
+        owner = future is None
+        if owner:
+            future = _inflight[key] = Future()
+
+    if not owner:
+        return future.result()
+
+    try:
+        result = call()
+        future.set_result(result)
+        return result
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            del _inflight[key]
+
+
+def categorize_email(subject, body):
+    return categorize_emails([subject], [body])[0]
+
+def categorize_emails(subjects, bodies):
+    """
+    Categorize several emails, packing the cache misses into shared LLM requests.
+
+    Up to CLASSIFICATION_BATCH_SIZE uncached emails are sent in each request.
+    Emails missing from a batched answer are categorized on their own.
+
+    Returns:
+        list: One category per email, in input order
+    """
+    cache = get_classification_cache()
+    categories = [None] * len(subjects)
+    uncached = []
+
+    # Check keyword rules and the cache first
+    for index, (subject, body) in enumerate(zip(subjects, bodies)):
+        category = _fast_classify(subject, body)
+        if category:
+            print(f"⚡ Using keyword categorization: {category}")
+            categories[index] = category
+            continue
+
+        try:
+            cached_result = cache.get_cached_classification(body, subject)
+        except Exception as e:
+            print(f"⚠️ Error checking categorization cache: {e}")
+            cached_result = None
+
         if cached_result:
             print(f"📋 Using cached categorization: {cached_result['category']} ({cached_result['cache_type']})")
-            return cached_result['category']
-        
-        # If not in cache, use LLM
-        print("🤖 Calling LLM for email categorization...")
-        prompt_content = f"""
-        You are an email categorization engine. Your task is to classify an email into one of the following categories based on its content:
-        - Important: Personal or work-related messages that seem to be from a real person and are not automated.
-        - Promotions: Marketing emails, special offers, newsletters.
-        - Updates: Notifications, shipping updates, social media alerts, forum digests.
-        - Spam: Unsolicited junk mail.
-
-        Analyze the email below and provide ONLY the category name.
-
-        Subject: {subject}
-        Body: {body}
+            categories[index] = cached_result['category']
+        else:
+            uncached.append(index)
+
+    # If not in cache, use LLM
+    labels = _label_in_batches(
+        uncached, subjects, bodies,
+        lambda index, category: cache.cache_classification(bodies[index], subjects[index], category, confidence=0.9),
+        batch_categorization_messages, _NUMBERED_CATEGORY_RE, CATEGORIES,
+        lambda index: _categorize_uncached(subjects[index], bodies[index], cache),
+        default="Updates", description="email categorizations",
+    )
+    for index, category in labels.items():
+        categories[index] = category
+
+    return categories
+
+def classify_emails(subjects, bodies, default="Updates"):
+    """
+    Give several emails their final label, asking the LLM once per email at most.
+
+    Keyword rules and cached categorizations and reply checks are used
+    first. Emails with nothing cached are labelled by one combined prompt
+    instead of a categorization request followed by a reply check.
+
+    Args:
+        default (str): Label for emails the LLM failed to label. None
+            leaves them None, so the caller can tell them apart; a failed
+            reply check then gives None too instead of "Unwanted Important".
+
+    Returns:
+        list: "Wanted Important", "Unwanted Important", "Promotions",
+        "Updates" or "Spam" (or default) per email, in input order
+    """
+    cache = get_classification_cache()
+    results = [None] * len(subjects)
+    important = []
+    uncached = []
+
+    # Check keyword rules and the cache first
+    for index, (subject, body) in enumerate(zip(subjects, bodies)):
+        category = _fast_classify(subject, body)
+        if category:
+            print(f"⚡ Using keyword categorization: {category}")
+            results[index] = category
+            continue
+
+        try:
+            cached_result = cache.get_cached_classification(body, subject)
+        except Exception as e:
+            print(f"⚠️ Error checking categorization cache: {e}")
+            cached_result = None
+
+        if not cached_result:
+            uncached.append(index)
+        elif cached_result['category'] == "Important":
+            important.append(index)
+        else:
+            print(f"📋 Using cached categorization: {cached_result['category']} ({cached_result['cache_type']})")
+            results[index] = cached_result['category']
+
+    # Known to be Important, only the reply check is left
+    if important:
+        reply_labels = check_replies_needed(
+            [subjects[index] for index in important],
+            [bodies[index] for index in important],
+            default="Unwanted Important" if default is not None else None,
+        )
+        for index, label in zip(important, reply_labels):
+            results[index] = label
+
+    # If not in cache, use LLM
+    labels = _label_in_batches(
+        uncached, subjects, bodies,
+        lambda index, label: _cache_final_label(cache, subjects[index], bodies[index], label),
+        batch_classification_messages, _NUMBERED_FINAL_RE, FINAL_LABELS,
+        lambda index: _classify_uncached(subjects[index], bodies[index], cache, default),
+        default=default, description="email classifications",
+    )
+    for index, label in labels.items():
+        results[index] = label
+
+    return results
+
+def _cache_final_label(cache, subject, body, label):
+    """Cache a final label as the categorization and, for Important emails, the reply check."""
+    if label in REPLY_LABELS:
+        cache.cache_classification(body, subject, "Important", confidence=0.9)
+        cache.cache_classification(f"REPLY_CHECK: {body}", subject, label, confidence=0.9)
+    else:
+        cache.cache_classification(body, subject, label, confidence=0.9)
+
+def _classify_uncached(subject, body, cache, default="Updates"):
+    """Give one email its final label with its own LLM request."""
+    try:
+        def classify():
+            print("🤖 Calling LLM for email classification...")
+            _llm_rate_limiter.acquire(1)
+            chat_completion = client.chat.completions.create(
+                messages=classification_messages(subject, body),
+                model=CLASSIFICATION_MODEL,
+                temperature=0.0
+            )
+            
+            label = chat_completion.choices[0].message.content.strip()
+            
+            # Cache the result
+            _cache_final_label(cache, subject, body, label)
+            
+            return label
         
-        CRITICAL INSTRUCTION: Your entire response must be ONLY one of the following single words: Important, Promotions, Updates, Spam.
-        """
+        # Identical emails classified at the same time share one LLM call
+        return _coalesced(("classify", subject, body), classify)
+
+    except Exception as e:
+        print(f"⚠️ Error classifying email: {e}")
+        return default
+
+def _label_in_batches(indices, subjects, bodies, store, build_messages, label_re, labels, label_one, default, description):
+    """
+    Label uncached emails with shared LLM requests of up to CLASSIFICATION_BATCH_SIZE emails.
+
+    Up to CLASSIFICATION_WORKERS requests are in flight at once.
 
+    Args:
+        indices (list): Positions in subjects/bodies to label
+        store (callable): (index, label) -> None, caches a batched result
+        build_messages (callable): (subjects, bodies) -> chat messages
+        label_re (re.Pattern): Matches the numbered answer lines
+        labels (tuple): Valid labels, matched case-insensitively
+        label_one (callable): index -> label, for emails sent on their own
+        default (str): Label used when a batched request fails
+        description (str): Used in progress and error messages
+
+    Returns:
+        dict: index -> label
+    """
+    canonical = {label.lower(): label for label in labels}
+    results = {}
+
+    chunks = [indices[i:i + CLASSIFICATION_BATCH_SIZE] for i in range(0, len(indices), CLASSIFICATION_BATCH_SIZE)]
+    batched = [chunk for chunk in chunks if len(chunk) > 1]
+
+    def request(chunk):
+        print(f"🤖 Calling LLM for {len(chunk)} {description}...")
+        _llm_rate_limiter.acquire(1)
         chat_completion = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt_content}],
+            messages=build_messages(
+                [subjects[index] for index in chunk],
+                [bodies[index] for index in chunk],
+            ),
             model=CLASSIFICATION_MODEL,
             temperature=0.0
         )
+        return chat_completion.choices[0].message.content
+
+    # Requests run concurrently; the cache is only touched from this thread
+    with ThreadPoolExecutor(max_workers=max(1, min(CLASSIFICATION_WORKERS, len(batched)))) as executor:
+        answers = [executor.submit(request, chunk) for chunk in batched]
+
+    for chunk in chunks:
+        if len(chunk) == 1:
+            results[chunk[0]] = label_one(chunk[0])
+            continue
+
+        try:
+            answer = answers.pop(0).result()
+            numbered = {
+                int(number): canonical[" ".join(label.lower().split())]
+                for number, label in label_re.findall(answer)
+            }
+        except Exception as e:
+            print(f"⚠️ Error requesting {description}: {e}")
+            for index in chunk:
+                results[index] = default
+            continue
+
+        for number, index in enumerate(chunk, 1):
+            label = numbered.get(number)
+            if label is None:
+                # Missing from the batched answer, ask for this email alone
+                results[index] = label_one(index)
+                continue
+            try:
+                # Cache the result
+                store(index, label)
+            except Exception as e:
+                print(f"⚠️ Error caching {description}: {e}")
+            results[index] = label
+
+    return results
+
+def _categorize_uncached(subject, body, cache):
+    """Categorize one email with its own LLM request."""
+    try:
+        def classify():
+            print("🤖 Calling LLM for email categorization...")
+            _llm_rate_limiter.acquire(1)
+            chat_completion = client.chat.completions.create(
+                messages=categorization_messages(subject, body),
+                model=CLASSIFICATION_MODEL,
+                temperature=0.0
+            )
+            
+            category = chat_completion.choices[0].message.content.strip()
+            
+            # Cache the result
+            cache.cache_classification(body, subject, category, confidence=0.9)
+            
+            return category
         
-        category = chat_completion.choices[0].message.content.strip()
-        
-        # Cache the result
-        cache.cache_classification(body, subject, category, confidence=0.9)
-        
-        return category
+        # Identical emails classified at the same time share one LLM call
+        return _coalesced((subject, body), classify)
 
     except Exception as e:
         print(f"⚠️ Error categorizing email: {e}")
         return "Updates"
 
-def check_if_reply_needed(subject, body):
+def check_if_reply_needed(subject, body, default="Unwanted Important"):
+    # Check keyword rules first, as check_replies_needed does
+    label = _fast_classify(subject, body, _REPLY_KEYWORD_PATTERNS)
+    if label:
+        print(f"⚡ Using keyword reply classification: {label}")
+        return label
+
     try:
-        # Check cache first (using a different cache key prefix for reply classification)
+        # Check cache next (using a different cache key prefix for reply classification)
         cache = get_classification_cache()
         cache_key_content = f"REPLY_CHECK: {body}"
         cached_result = cache.get_cached_classification(cache_key_content, subject)
@@ -75,31 +495,9 @@ def check_if_reply_needed(subject, body):
         
         # If not in cache, use LLM
         print("🤖 Calling LLM for reply classification...")
-        # This is your highly detailed prompt for checking if a reply is needed
-        prompt_content = f"""
-        You are a hyper-efficient executive assistant AI. Your sole purpose is to classify incoming emails based on a strict set of rules provided by your user to determine if a personal reply is mandatory.
-
-        Here are the user's exact classification rules:
-
-        **1. Wanted Important:** This category is for any email which requires a direct, personal response.
-        **2. Unwanted Important:** This category is for emails that contain important information but DO NOT require a reply.
-        
-        --- RULES & EXAMPLES ---
-        - Emails from recruiters asking for availability are 'Wanted Important'.
-        - Emails from colleagues asking for a file or your time are 'Wanted Important'.
-        - Security alerts, company newsletters, and order confirmations are 'Unwanted Important'.
-        ---
-
-        Analyze the following email based ONLY on these rules.
-
-        Email to Classify:
-        Subject: {subject}
-        Body: {body}
-
-        CRITICAL INSTRUCTION: Your entire response must be ONLY the words "Wanted Important" or "Unwanted Important". Do not include any other text.
-        """
+        _llm_rate_limiter.acquire(1)
         chat_completion = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt_content}],
+            messages=reply_check_messages(subject, body),
             model=CLASSIFICATION_MODEL,
             temperature=0.0
         )
@@ -113,34 +511,97 @@ def check_if_reply_needed(subject, body):
 
     except Exception as e:
         print(f"⚠️ Error classifying email importance: {e}")
-        return "Unwanted Important"
+        return default
 
+def check_replies_needed(subjects, bodies, default="Unwanted Important"):
+    """
+    Check several emails for a needed reply, packing the cache misses into shared LLM requests.
 
-def generate_response(email_body, use_summary=False):
-    # This function remains the same
-    try:
-        context_text = ""
-        if use_summary and len(email_body) > 2000:
-            context = ai_summarize(email_body)
-            context_text = f"Here's a summary for context:\n{context}\n"
+    Returns:
+        list: "Wanted Important" or "Unwanted Important" (or default, when
+        the LLM failed) per email, in input order
+    """
+    cache = get_classification_cache()
+    cache_bodies = [f"REPLY_CHECK: {body}" for body in bodies]
+    results = [None] * len(subjects)
+    uncached = []
 
-        prompt_content = f"""
-        You are an AI assistant. Write a polite and concise response to the following email.
-        Do not include signatures. Keep your response professional, friendly, and specific to any questions or requests.
+    # Check keyword rules and the cache first
+    for index, (subject, body, cache_body) in enumerate(zip(subjects, bodies, cache_bodies)):
+        label = _fast_classify(subject, body, _REPLY_KEYWORD_PATTERNS)
+        if label:
+            print(f"⚡ Using keyword reply classification: {label}")
+            results[index] = label
+            continue
 
-        {context_text}
-        Email Body:
-        {email_body}
+        try:
+            cached_result = cache.get_cached_classification(cache_body, subject)
+        except Exception as e:
+            print(f"⚠️ Error checking reply classification cache: {e}")
+            cached_result = None
 
-        Your Response:
-        """
+        if cached_result:
+            print(f"📋 Using cached reply classification: {cached_result['category']} ({cached_result['cache_type']})")
+            results[index] = cached_result['category']
+        else:
+            uncached.append(index)
 
-        chat_completion = client.chat.completions.create(
-            messages=[{"role": "user", "content": prompt_content}],
-            model=RESPONSE_MODEL,
-        )
-        return chat_completion.choices[0].message.content.strip()
+    # If not in cache, use LLM
+    labels = _label_in_batches(
+        uncached, subjects, bodies,
+        lambda index, label: cache.cache_classification(cache_bodies[index], subjects[index], label, confidence=0.9),
+        batch_reply_check_messages, _NUMBERED_REPLY_RE, REPLY_LABELS,
+        lambda index: check_if_reply_needed(subjects[index], bodies[index], default),
+        default=default, description="reply classifications",
+    )
+    for index, label in labels.items():
+        results[index] = label
+
+    return results
+
+
+def response_messages(email_body, use_summary=False):
+    """Build the chat messages used to draft a reply to an email."""
+    # Long emails get the summarization step folded into this same request
+    # rather than a separate ai_summarize round trip before it
+    context_text = ""
+    if use_summary and len(email_body) > 2000:
+        context_text = f"{LONG_EMAIL_INSTRUCTION}\n"
+
+    prompt_content = f"""{context_text}
+Email Body:
+{truncate_to_tokens(email_body, RESPONSE_BODY_TOKENS)}
+
+Your Response:"""
+    return [
+        {"role": "system", "content": RESPONSE_SYSTEM},
+        {"role": "user", "content": prompt_content},
+    ]
+
+
+def generate_response_stream(email_body, use_summary=False):
+    """
+    Stream a reply to an email as it is generated.
+
+    Yields:
+        str: Pieces of the reply text, the first one arriving after the
+        model's time to first token rather than its full decode time
+    """
+    _llm_rate_limiter.acquire(1)
+    stream = client.chat.completions.create(
+        messages=response_messages(email_body, use_summary),
+        model=RESPONSE_MODEL,
+        stream=True,
+    )
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+
+def generate_response(email_body, use_summary=False):
+    try:
+        return "".join(generate_response_stream(email_body, use_summary)).strip()
 
     except Exception as e:
         print(f"⚠️ Error generating response: {e}")
-        return "I'm sorry, I couldn’t generate a response."
\ No newline at end of file
+        return "I'm sorry, I couldn’t generate a response."
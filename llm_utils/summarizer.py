@@ -3,10 +3,15 @@ Email summarization utilities to reduce token usage and provide context.
 Includes basic heuristic summarization and optional AI-powered summarization.
 """
 
+import hashlib
 import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
 from typing import Optional
 from dotenv import load_dotenv
-from config.settings import EMAIL_SETTINGS
+from config.settings import EMAIL_SETTINGS, LLM_SETTINGS
 
 # Attempt to use OpenAI for AI summarization, fallback gracefully if unavailable
 try:
@@ -14,19 +19,80 @@ try:
 except Exception:
     OpenAI = None
 
+# Token counts use the model's tokenizer when available, else ~4 chars per token
+try:
+    import tiktoken
+except Exception:
+    tiktoken = None
+
 load_dotenv()
 
+# One client for the process, so summaries reuse its pooled keep-alive connections
+_api_key = os.getenv("OPENAI_API_KEY")
+_client = OpenAI(api_key=_api_key) if OpenAI is not None and _api_key else None
+
 SUMMARY_MAX_LENGTH = EMAIL_SETTINGS.get("SUMMARY_MAX_LENGTH", 300)
 AI_SUMMARY_THRESHOLD = EMAIL_SETTINGS.get("AI_SUMMARY_THRESHOLD", 1000)
 AI_SUMMARY_MAX_TOKENS = EMAIL_SETTINGS.get("AI_SUMMARY_MAX_TOKENS", 150)
+SUMMARY_CACHE_SIZE = EMAIL_SETTINGS.get("SUMMARY_CACHE_SIZE", 1024)
+AI_SUMMARY_INPUT_TOKENS = EMAIL_SETTINGS.get("AI_SUMMARY_INPUT_TOKENS", 3000)
+
+_WORD_RE = re.compile(r"\S+")
+
+# AI summaries by content hash, least recently used first
+_summary_cache = OrderedDict()
+_summary_cache_lock = threading.Lock()
+
+SUMMARY_INSTRUCTION = (
+    "Summarize the email content you are given into a concise, factual "
+    "summary capturing key actions, dates, amounts, and obligations."
+)
+
+
+@lru_cache(maxsize=None)
+def _get_encoding():
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.get_encoding(LLM_SETTINGS.get("TOKENIZER_ENCODING", "o200k_base"))
+    except Exception:
+        # Encoding files could not be loaded (e.g. offline)
+        return None
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text to at most max_tokens tokens, so prompts are bounded by what the API counts."""
+    # Every token covers at least one character
+    if not text or len(text) <= max_tokens:
+        return text
+
+    encoding = _get_encoding()
+    if encoding is None:
+        return text[:max_tokens * 4]
+
+    # Tokens average ~4 characters, so this prefix almost always holds more than
+    # max_tokens of them without encoding the whole text
+    prefix = text[:max_tokens * 8]
+    tokens = encoding.encode(prefix, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return prefix
+    return encoding.decode(tokens[:max_tokens])
 
 
 def basic_summarize(text: str, max_length: int = SUMMARY_MAX_LENGTH) -> str:
     """Heuristic-based summarization: returns the first N chars and trims noise."""
     if not text:
         return ""
-    # Simple heuristic: collapse whitespace, trim signatures and replies markers
-    cleaned = " ".join(text.split())
+    # Simple heuristic: collapse whitespace, trim signatures and replies markers.
+    # Only the words that fit are collected so long bodies aren't split whole.
+    words = []
+    length = -1
+    for match in _WORD_RE.finditer(text):
+        words.append(match.group())
+        length += len(words[-1]) + 1
+        if length > max_length:
+            break
+    cleaned = " ".join(words)
     # Truncate to max_length
     if len(cleaned) > max_length:
         cleaned = cleaned[:max_length].rstrip() + "…"
@@ -43,33 +109,43 @@ def ai_summarize(text: str, system_hint: Optional[str] = None) -> str:
         return basic_summarize(text)
 
     # Use OpenAI client if available and key is set
-    api_key = os.getenv("OPENAI_API_KEY")
-    if OpenAI is None or not api_key:
+    if _client is None:
         return basic_summarize(text, max_length=SUMMARY_MAX_LENGTH)
 
+    # Repeated newsletters and notifications reuse the earlier summary
+    key = hashlib.blake2b(f"{system_hint}\0{text}".encode("utf-8"), digest_size=16).hexdigest()
+    with _summary_cache_lock:
+        if key in _summary_cache:
+            _summary_cache.move_to_end(key)
+            return _summary_cache[key]
+
     try:
-        client = OpenAI(api_key=api_key)
-        messages = []
+        # Fixed instructions first, so repeated calls share a cacheable prefix
+        system_content = SUMMARY_INSTRUCTION
         if system_hint:
-            messages.append({"role": "system", "content": system_hint})
-        messages.append({
-            "role": "user",
-            "content": (
-                "Summarize the following email content into a concise, factual "
-                "summary capturing key actions, dates, amounts, and obligations.\n\n" + text
-            ),
-        })
-        chat = client.chat.completions.create(
+            system_content = f"{system_hint}\n\n{SUMMARY_INSTRUCTION}"
+        messages = [
+            {"role": "system", "content": system_content},
+            {"role": "user", "content": truncate_to_tokens(text, AI_SUMMARY_INPUT_TOKENS)},
+        ]
+        chat = _client.chat.completions.create(
             model=os.getenv("OPENAI_SUMMARY_MODEL", "gpt-4o-mini"),
             temperature=0.0,
             max_tokens=AI_SUMMARY_MAX_TOKENS,
             messages=messages,
         )
-        return chat.choices[0].message.content.strip()
+        summary = chat.choices[0].message.content.strip()
     except Exception:
         # In case of any error, fallback to basic
         return basic_summarize(text, max_length=SUMMARY_MAX_LENGTH)
 
+    # Only successful AI summaries are cached, fallbacks are retried next time
+    with _summary_cache_lock:
+        _summary_cache[key] = summary
+        if len(_summary_cache) > SUMMARY_CACHE_SIZE:
+            _summary_cache.popitem(last=False)
+    return summary
+
 
 def summarize_email(subject: str, body: str) -> str:
     """Summarize an email using heuristic or AI based on size."""
@@ -1,9 +1,13 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from workflows.new_emails import process_new_emails
 from workflows.existing_emails import process_existing_emails
 from workflows.cleanup import daily_cleanup
+from gmail_utils.retry import configure_logging
 
 if __name__ == "__main__":
+    configure_logging()
+
     parser = argparse.ArgumentParser(description="Automate Gmail management using LangGraph.")
     parser.add_argument(
         "--count",
@@ -11,17 +15,34 @@ if __name__ == "__main__":
         default=5,
         help="Number of existing emails to classify. Default is 5."
     )
+    parser.add_argument(
+        "--existing",
+        action="store_true",
+        help="Also run the existing emails workflow for --count emails."
+    )
+    parser.add_argument(
+        "--cleanup",
+        action="store_true",
+        help="Also run the daily cleanup workflow."
+    )
     args = parser.parse_args()
 
-    # Pass the user-specified count to the workflow
-    print("=== Running New Emails Workflow ===")
-    new_wf = process_new_emails()
-    new_wf.invoke({})
+    # Each entry is (banner, compiled workflow, initial state)
+    workflows = [("=== Running New Emails Workflow ===", process_new_emails(), {})]
+
+    if args.existing:
+        # Pass the user-specified count to the workflow
+        workflows.append((f"=== Running Existing Emails Workflow for {args.count} emails ===", process_existing_emails(), {"count": args.count}))
 
-    # print(f"=== Running Existing Emails Workflow for {args.count} emails ===")
-    # existing_wf = process_existing_emails()
-    # existing_wf.invoke({"count": args.count}) # Pass the count as part of the initial state
+    if args.cleanup:
+        workflows.append(("=== Running Daily Cleanup ===", daily_cleanup(), {}))
 
-    # print("=== Running Daily Cleanup ===")
-    # cleanup_wf = daily_cleanup()
-    # cleanup_wf.invoke({})
\ No newline at end of file
+    # The enabled workflows work on separate Gmail queries, so their API and
+    # LLM round trips overlap instead of running back to back
+    with ThreadPoolExecutor(max_workers=len(workflows)) as executor:
+        futures = []
+        for banner, workflow, state in workflows:
+            print(banner)
+            futures.append(executor.submit(workflow.invoke, state))
+        for future in futures:
+            future.result()
@@ -1,66 +1,117 @@
 import json
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
 import os
+import threading
 from config.settings import RAG_SETTINGS
-from llm_utils.classifier import categorize_email
+from llm_utils.classifier import categorize_emails
+from partial_rag.rag_utils import configure_faiss, load_model, new_index
 
-# INITIAL SETUP
-model = SentenceTransformer(RAG_SETTINGS.get('MODEL_NAME','all-MiniLM-L6-v2'))
+configure_faiss()
 
-# Load FAISS index if exists, else create new
-if os.path.exists(RAG_SETTINGS.get('INDEX_PATH')):
-    index = faiss.read_index(RAG_SETTINGS.get('INDEX_PATH'))
-    print(f"✅ Loaded existing FAISS index with {index.ntotal} entries.")
-else:
-    index = faiss.IndexFlatIP(384)  # Inner Product for cosine similarity
-    index = faiss.IndexIDMap(index)
-    print("⚙️ Created new FAISS index (cosine similarity).")
+# Model, index and metadata are loaded on first use, so importing this
+# module doesn't stall on reading them from disk
+model = None
+index = None
+metadata = []
+next_id = 0
+# Labels by index ID, so a search hit is resolved without scanning metadata
+label_by_id = {}
+_load_lock = threading.Lock()
 
-# Load metadata if exists
-if os.path.exists(RAG_SETTINGS.get('METADATA_PATH')):
-    with open(RAG_SETTINGS.get('METADATA_PATH'), "r") as f:
-        metadata = json.load(f)
-else:
-    metadata = []
+def _ensure_loaded():
+    global model, index, metadata, next_id, label_by_id
 
-next_id = max([m["id"] for m in metadata], default=-1) + 1
+    with _load_lock:
+        if index is not None:
+            return
+
+        model = load_model()
+
+        # Load FAISS index if exists, else create new
+        if os.path.exists(RAG_SETTINGS.get('INDEX_PATH')):
+            index = faiss.read_index(RAG_SETTINGS.get('INDEX_PATH'))
+            print(f"✅ Loaded existing FAISS index with {index.ntotal} entries.")
+        else:
+            index = new_index()
+            print("⚙️ Created new FAISS index (cosine similarity).")
+
+        # Load metadata if exists
+        if os.path.exists(RAG_SETTINGS.get('METADATA_PATH')):
+            with open(RAG_SETTINGS.get('METADATA_PATH'), "r") as f:
+                metadata = json.load(f)
+        else:
+            metadata = []
+
+        next_id = max([m["id"] for m in metadata], default=-1) + 1
+        label_by_id = {m["id"]: m["label"] for m in metadata}
 
 # FUNCTION: CLASSIFY OR ADD MAIL
 def classify_(subject: str, body: str):
+    return classify_batch([{"subject": subject, "body": body}])[0]
+
+# FUNCTION: CLASSIFY OR ADD A BATCH OF MAILS
+def classify_batch(emails: list):
+    """
+    Label emails from their nearest stored neighbour, categorizing and indexing the rest.
+
+    All texts are embedded in one model.encode call and searched with one
+    index.search call, instead of one forward pass and search per email.
+    """
     global next_id, metadata
 
-    text = subject + " " + body
-    embedding = model.encode([text], convert_to_numpy=True)
-    embedding = embedding / np.linalg.norm(embedding, axis=1, keepdims=True)  # normalize
+    if not emails:
+        return []
 
+    _ensure_loaded()
+
+    texts = [email["subject"] + " " + email["body"] for email in emails]
+    embeddings = model.encode(
+        texts,
+        batch_size=RAG_SETTINGS.get('ENCODE_BATCH_SIZE', 64),
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+    )
+
+    labels = [None] * len(emails)
     if index.ntotal > 0:
-        D, I = index.search(embedding, k=1)
-        similarity = D[0][0]  # cosine similarity directly
-        print(f"🔍 Similarity score: {similarity:.3f}")
-
-        if similarity >= RAG_SETTINGS.get('SIMILARITY_THRESHOLD','0.75'):
-            matched_id = int(I[0][0])
-            matched_label = next((m["label"] for m in metadata if m["id"] == matched_id), None)
-            print(f"✅ Similar mail found → Label: {matched_label}")
-            return matched_label
-
-    print("⚠️ No similar mail found → Adding to index.")
-    new_id = next_id
-    index.add_with_ids(embedding, np.array([new_id]))
-    label=categorize_email(subject=subject,body=body)
-    metadata.append({
-        "id": new_id,
-        "subject": subject,
-        "label": label
-    })
-    next_id += 1
-
-    return label
+        D, I = index.search(embeddings, k=1)
+        for i in range(len(emails)):
+            similarity = D[i][0]  # cosine similarity directly
+            print(f"🔍 Similarity score: {similarity:.3f}")
+
+            if similarity >= RAG_SETTINGS.get('SIMILARITY_THRESHOLD', 0.75):
+                matched_id = int(I[i][0])
+                labels[i] = label_by_id.get(matched_id)
+                print(f"✅ Similar mail found → Label: {labels[i]}")
+
+    misses = [i for i in range(len(emails)) if labels[i] is None]
+    if misses:
+        print(f"⚠️ No similar mail found for {len(misses)} mails → Adding to index.")
+        new_labels = categorize_emails(
+            subjects=[emails[i]["subject"] for i in misses],
+            bodies=[emails[i]["body"] for i in misses],
+        )
+        new_ids = np.arange(next_id, next_id + len(misses))
+        if not index.is_trained:
+            index.train(embeddings[misses])  # no-op for float16, but required before adding
+        index.add_with_ids(embeddings[misses], new_ids)
+        for i, new_id, label in zip(misses, new_ids, new_labels):
+            labels[i] = label
+            label_by_id[int(new_id)] = label
+            metadata.append({
+                "id": int(new_id),
+                "subject": emails[i]["subject"],
+                "label": label
+            })
+        next_id += len(misses)
+
+    return labels
 
 # FUNCTION: SAVE INDEX + METADATA
 def save_index():
+    if index is None:
+        return  # Nothing loaded, nothing changed
     faiss.write_index(index, RAG_SETTINGS.get('INDEX_PATH'))
     with open(RAG_SETTINGS.get('METADATA_PATH'), "w") as f:
         json.dump(metadata, f, indent=4)
@@ -1,7 +1,17 @@
 import json
+import os
+import sys
 import numpy as np
 import faiss
-from sentence_transformers import SentenceTransformer
+import torch
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.settings import RAG_SETTINGS
+from partial_rag.rag_utils import configure_faiss, load_model, new_index
+
+configure_faiss()
 
 # === Load dataset ===
 with open("test_data.json", "r") as f:
@@ -10,26 +20,30 @@ with open("test_data.json", "r") as f:
 # === Prepare email texts and IDs ===
 texts = [item["subject"] + " " + item["body"] for item in data]
 labels = [item["label"] for item in data]
-ids = np.arange(len(texts))  # numeric IDs 0..99
+ids = np.arange(len(texts), dtype=np.int64)  # numeric IDs 0..99, in the dtype FAISS takes
 
 # === Load embedding model ===
-model = SentenceTransformer("all-MiniLM-L6-v2")
+# Bulk embedding runs on the GPU when there is one
+device = "cuda" if torch.cuda.is_available() else "cpu"
+# Same model (and int8 ONNX export) email_classifier embeds queries with
+model = load_model(device)
 
 # === Generate & normalize embeddings ===
-embeddings = model.encode(texts, convert_to_numpy=True)
-embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)  # normalize manually
+# Large batches keep the model busy; normalization happens inside encode
+embeddings = model.encode(texts, batch_size=256, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=True)
 
 dimension = embeddings.shape[1]
 
 # === Create FAISS index (Cosine similarity using Inner Product) ===
-index = faiss.IndexFlatIP(dimension)  # Inner Product = cosine similarity (for normalized vectors)
-index = faiss.IndexIDMap(index)
+# HNSW graph with the RAG_SETTINGS parameters email_classifier creates new indexes with
+index = new_index(dimension)
 
-# Add vectors + IDs
+# Add vectors + IDs (training is a no-op for float16, but required first)
+index.train(embeddings)
 index.add_with_ids(embeddings, ids)
 
 # === Save index and metadata ===
-faiss.write_index(index, "email_index.faiss")
+faiss.write_index(index, RAG_SETTINGS.get('INDEX_PATH'))
 
 metadata = [
     {
@@ -41,7 +55,7 @@ metadata = [
     for i in range(len(data))
 ]
 
-with open("metadata.json", "w") as f:
+with open(RAG_SETTINGS.get('METADATA_PATH'), "w") as f:
     json.dump(metadata, f, indent=4)
 
 print("✅ FAISS index and metadata created successfully!")
@@ -0,0 +1,34 @@
+import os
+import faiss
+from sentence_transformers import SentenceTransformer
+from config.settings import RAG_SETTINGS
+
+# Shared by initial_index and email_classifier, so the index build and the
+# query side use the same FAISS setup, embedding model and HNSW parameters
+
+def configure_faiss():
+    """Search on every core and check a SIMD build of the distance kernels was loaded."""
+    faiss.omp_set_num_threads(os.cpu_count() or 1)
+    compile_options = faiss.get_compile_options() if hasattr(faiss, "get_compile_options") else ""
+    if not any(simd in compile_options for simd in ("AVX2", "AVX512", "NEON")):
+        print(f"⚠️ FAISS was loaded without SIMD kernels ({compile_options or 'unknown build'}), install faiss-cpu for faster search.")
+
+def load_model(device=None):
+    """Load the embedding model, preferring its int8 ONNX export on CPU."""
+    model_name = RAG_SETTINGS.get('MODEL_NAME', 'all-MiniLM-L6-v2')
+    onnx_file = RAG_SETTINGS.get('ONNX_FILE')
+    if onnx_file:
+        try:
+            return SentenceTransformer(model_name, device=device, backend="onnx", model_kwargs={"file_name": onnx_file})
+        except Exception as e:
+            print(f"⚠️ Could not load quantized ONNX model ({e}), using PyTorch.")
+    return SentenceTransformer(model_name, device=device)
+
+def new_index(dimension=384):
+    """Create an empty ID-mapped index for normalized embeddings."""
+    # HNSW graph over inner products (cosine similarity), sub-linear search.
+    # Vectors are stored as float16, halving the memory each search reads.
+    index = faiss.IndexHNSWSQ(dimension, faiss.ScalarQuantizer.QT_fp16, RAG_SETTINGS.get('HNSW_M', 32), faiss.METRIC_INNER_PRODUCT)
+    index.hnsw.efConstruction = RAG_SETTINGS.get('HNSW_EF_CONSTRUCTION', 80)
+    index.hnsw.efSearch = RAG_SETTINGS.get('HNSW_EF_SEARCH', 32)  # saved with the index
+    return faiss.IndexIDMap2(index)
@@ -0,0 +1,187 @@
+"""
+Tests for the concurrent Gmail batch helpers in gmail_utils.actions, run
+against a scripted fake batch service instead of the Gmail API.
+"""
+
+import base64
+import email
+import email.policy
+import os
+import sys
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# gmail_utils.actions imports the classifier, which builds an OpenAI client
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import gmail_utils.actions as actions
+
+
+def http_error(status, retry_after=None):
+    headers = {"status": str(status)}
+    if retry_after is not None:
+        headers["retry-after"] = retry_after
+    return HttpError(httplib2.Response(headers), b"")
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.service.sent.append([request for _, request in self.requests])
+        outcome = self.service.script.pop(0) if self.service.script else {}
+        if isinstance(outcome, Exception):
+            raise outcome
+        for request_id, item in self.requests:
+            exception = outcome.get(item)
+            self.callback(request_id, None if exception else {"id": item}, exception)
+
+
+class FakeService:
+    """
+    Each execute() takes the next script entry: an exception fails the whole
+    batch, a dict maps items to the exception their member fails with.
+    """
+
+    def __init__(self, script=()):
+        self.script = list(script)
+        self.sent = []
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+
+class FakeMonitor:
+    def __init__(self):
+        self.calls = []
+
+    def record_api_call(self, call_type, quota_cost=1, success=True):
+        self.calls.append((call_type, quota_cost, success))
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(actions.time, "sleep", delays.append)
+    return delays
+
+
+@pytest.fixture
+def monitor(monkeypatch):
+    fake = FakeMonitor()
+    monkeypatch.setattr(actions, "get_quota_monitor", lambda: fake)
+    return fake
+
+
+def run_batches(monkeypatch, service, items):
+    monkeypatch.setattr(actions, "get_gmail_service", lambda: service)
+    succeeded = []
+    actions._execute_batches(
+        items,
+        lambda service, item: item,
+        "trash",
+        "trashing message",
+        on_success=lambda item, response: succeeded.append(item),
+    )
+    return succeeded
+
+
+def test_member_retry_after_is_honored(monkeypatch, sleeps, monitor):
+    service = FakeService([{"b": http_error(429, retry_after="7")}, {}])
+
+    succeeded = run_batches(monkeypatch, service, ["a", "b", "c"])
+
+    assert service.sent == [["a", "b", "c"], ["b"]]
+    assert sleeps == [7.0]
+    assert sorted(succeeded) == ["a", "b", "c"]
+    assert monitor.calls == [("trash", 15, True), ("trash", 5, True)]
+
+
+def test_member_without_retry_after_backs_off(monkeypatch, sleeps, monitor):
+    service = FakeService([{"a": http_error(503)}, {}])
+
+    succeeded = run_batches(monkeypatch, service, ["a"])
+
+    assert service.sent == [["a"], ["a"]]
+    assert len(sleeps) == 1 and 0 < sleeps[0] <= actions.BACKOFF_CAP
+    assert succeeded == ["a"]
+
+
+def test_non_retryable_member_is_not_resent(monkeypatch, sleeps, monitor):
+    service = FakeService([{"b": http_error(404)}])
+
+    succeeded = run_batches(monkeypatch, service, ["a", "b"])
+
+    assert service.sent == [["a", "b"]]
+    assert succeeded == ["a"]
+    assert sleeps == []
+
+
+def test_failed_batch_is_retried_with_only_pending_members(monkeypatch, sleeps, monitor):
+    service = FakeService([{"b": http_error(500)}, http_error(503), {}])
+
+    succeeded = run_batches(monkeypatch, service, ["a", "b"])
+
+    # "a" already succeeded, so neither retry sends it again
+    assert service.sent == [["a", "b"], ["b"], ["b"]]
+    assert sorted(succeeded) == ["a", "b"]
+    assert ("trash", 5, False) in monitor.calls
+
+
+def test_batch_failing_every_retry_is_reported_not_raised(monkeypatch, sleeps, monitor):
+    service = FakeService([http_error(503)] * (actions.MAX_RETRIES + 1))
+
+    succeeded = run_batches(monkeypatch, service, ["a"])
+
+    assert len(service.sent) == actions.MAX_RETRIES + 1
+    assert succeeded == []
+
+
+def test_id_chunks_are_split_and_retried(monkeypatch, sleeps, monitor):
+    sent = []
+    failures = [http_error(503)]
+
+    class Request:
+        def __init__(self, ids):
+            self.ids = ids
+
+        def execute(self):
+            sent.append(self.ids)
+            if len(self.ids) < 1000 and failures:
+                raise failures.pop()
+
+    monkeypatch.setattr(actions, "get_gmail_service", lambda: None)
+    ids = [str(i) for i in range(2500)]
+    actions._execute_id_chunks(ids, lambda service, chunk: Request(chunk), "batchModify", "moving messages")
+
+    assert sorted(len(chunk) for chunk in sent) == [500, 500, 1000, 1000]
+    assert {id for chunk in sent for id in chunk} == set(ids)
+    assert monitor.calls.count(("batchModify", 50, True)) == 3
+    assert monitor.calls.count(("batchModify", 50, False)) == 1
+
+
+def test_raw_reply_encodes_non_ascii_headers():
+    raw = base64.urlsafe_b64decode(
+        actions._build_raw_reply("Café menu ✓ " * 8, "Merci — à bientôt", "José Núñez <jose@example.com>")
+    )
+
+    # Headers are 7-bit after RFC 2047 encoding, only the 8bit body is not
+    headers, body = raw.split(b"\r\n\r\n", 1)
+    assert headers.isascii()
+    assert b"\n" not in headers.replace(b"\r\n", b"")
+
+    message = email.message_from_bytes(raw, policy=email.policy.default)
+    assert message["Subject"] == "Re: " + "Café menu ✓ " * 8
+    assert message["To"] == "José Núñez <jose@example.com>"
+    assert message.get_content() == "Merci — à bientôt"
@@ -11,7 +11,13 @@ import time
 # Add the project root to Python path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from llm_utils.cache import get_classification_cache
+import hashlib
+import json
+
+import pytest
+
+import llm_utils.cache as cache_module
+from llm_utils.cache import ClassificationCache, get_classification_cache
 
 def test_caching_functionality():
     """Test the email classification caching system."""
@@ -109,5 +115,167 @@ def test_caching_functionality():
     print(f"\n🎉 Cache testing completed!")
     print("=" * 50)
 
+
+# Distinct emails, long enough to be cached and too different to match each other
+EMAILS = [
+    ("Quarterly budget review", "Please send the revised quarterly budget spreadsheet before the finance meeting on Thursday."),
+    ("Garden club newsletter", "Our spring planting workshop covers tomatoes, herbs and companion planting for small balconies."),
+    ("Flight itinerary changed", "Your connecting flight through Denver now departs ninety minutes later, gate assignments follow."),
+    ("Library book overdue", "The mystery novel you borrowed three weeks ago is overdue, renew it online to avoid fines."),
+    ("Bicycle repair estimate", "Replacing the rear derailleur, chain and brake pads on your touring bike will take two days."),
+    ("Choir rehearsal moved", "Tuesday rehearsal moves to the church hall, bring the new sheet music for the winter concert."),
+]
+
+
+def _make_cache(tmp_path, monkeypatch, **settings):
+    """Build a cache whose files live in tmp_path, overriding the given settings."""
+    monkeypatch.setitem(cache_module.CLASSIFICATION_CACHE_SETTINGS, "CACHE_FILE", str(tmp_path / "classification_cache.jsonl"))
+    for key, value in settings.items():
+        monkeypatch.setitem(cache_module.CLASSIFICATION_CACHE_SETTINGS, key, value)
+    return ClassificationCache()
+
+
+def _subjects(cache):
+    return [entry["subject"] for entry in cache._cache_data["classifications"].values()]
+
+
+def _log_lines(cache):
+    with open(cache.cache_file, "rb") as f:
+        return sum(1 for _ in f)
+
+
+def test_lru_order_survives_restart(tmp_path, monkeypatch):
+    cache = _make_cache(tmp_path, monkeypatch, MAX_CACHE_SIZE=3)
+    for subject, body in EMAILS[:3]:
+        cache.cache_classification(body, subject, "Updates")
+    
+    # A hit makes the first email the most recently used
+    subject, body = EMAILS[0]
+    assert cache.get_cached_classification(body, subject)["cache_type"] == "exact_match"
+    
+    reloaded = _make_cache(tmp_path, monkeypatch, MAX_CACHE_SIZE=3)
+    assert _subjects(reloaded) == [EMAILS[1][0], EMAILS[2][0], EMAILS[0][0]]
+    
+    # The least recently used entry is evicted next
+    subject, body = EMAILS[3]
+    reloaded.cache_classification(body, subject, "Updates")
+    assert _subjects(reloaded) == [EMAILS[2][0], EMAILS[0][0], EMAILS[3][0]]
+
+
+def test_log_is_compacted_past_one_and_a_half_times_max_size(tmp_path, monkeypatch):
+    cache = _make_cache(tmp_path, monkeypatch, MAX_CACHE_SIZE=4)
+    for subject, body in EMAILS[:4]:
+        cache.cache_classification(body, subject, "Updates")
+    assert _log_lines(cache) == 4
+    
+    # Hits append lines until the log passes 6 lines and is rewritten
+    subject, body = EMAILS[0]
+    cache.get_cached_classification(body, subject)
+    cache.get_cached_classification(body, subject)
+    assert _log_lines(cache) == 6
+    cache.get_cached_classification(body, subject)
+    assert _log_lines(cache) == 4
+    
+    reloaded = _make_cache(tmp_path, monkeypatch, MAX_CACHE_SIZE=4)
+    assert _subjects(reloaded) == [EMAILS[1][0], EMAILS[2][0], EMAILS[3][0], EMAILS[0][0]]
+
+
+def test_long_log_is_compacted_on_load(tmp_path, monkeypatch):
+    cache = _make_cache(tmp_path, monkeypatch, MAX_CACHE_SIZE=100)
+    for subject, body in EMAILS[:2]:
+        cache.cache_classification(body, subject, "Updates")
+    for _ in range(5):
+        cache.get_cached_classification(EMAILS[0][1], EMAILS[0][0])
+    assert _log_lines(cache) == 7
+    
+    reloaded = _make_cache(tmp_path, monkeypatch, MAX_CACHE_SIZE=4)
+    assert _log_lines(reloaded) == 2
+    assert _subjects(reloaded) == [EMAILS[1][0], EMAILS[0][0]]
+
+
+def test_legacy_json_cache_is_migrated_and_rehashed(tmp_path, monkeypatch):
+    cache = _make_cache(tmp_path, monkeypatch)
+    legacy = []
+    for i, (subject, body) in enumerate(EMAILS[:2]):
+        full_content = f"{subject} {body}"
+        processed = cache._preprocess_content(full_content)
+        legacy.append({
+            "content": full_content,
+            # Entries written before xxhash were keyed by md5
+            "content_hash": hashlib.md5(processed.encode("utf-8")).hexdigest(),
+            "category": "Promotions",
+            "confidence": 0.9,
+            "timestamp": time.time() - 10 + i,
+            "subject": subject,
+        })
+    with open(tmp_path / "classification_cache.json", "w") as f:
+        json.dump({"classifications": legacy}, f)
+    assert not os.path.exists(cache.cache_file)
+    
+    migrated = _make_cache(tmp_path, monkeypatch)
+    hashes = list(migrated._cache_data["classifications"])
+    assert _subjects(migrated) == [EMAILS[0][0], EMAILS[1][0]]
+    assert all(len(content_hash) == cache_module.CONTENT_HASH_LENGTH for content_hash in hashes)
+    assert _log_lines(migrated) == 2
+    
+    subject, body = EMAILS[1]
+    result = migrated.get_cached_classification(body, subject)
+    assert result["category"] == "Promotions"
+    assert result["cache_type"] == "exact_match"
+
+
+def test_saved_index_with_other_settings_is_rejected(tmp_path, monkeypatch):
+    cache = _make_cache(tmp_path, monkeypatch)
+    for subject, body in EMAILS[:2]:
+        cache.cache_classification(body, subject, "Updates")
+    cache._save_index()
+    
+    matrix, row_hashes, _ = cache._load_index()
+    assert matrix is not None
+    assert row_hashes == list(cache._cache_data["classifications"])
+    
+    # An index built with another vectorizer size must not be reused
+    with open(cache.index_files["meta"], "rb") as f:
+        meta = json.loads(f.read())
+    meta["n_features"] = 2 ** 10
+    with open(cache.index_files["meta"], "w") as f:
+        json.dump(meta, f)
+    assert cache._load_index() == (None, [], None)
+    
+    reloaded = _make_cache(tmp_path, monkeypatch)
+    assert reloaded._cache_matrix.shape == (2, reloaded.vectorizer.n_features)
+    subject, body = EMAILS[0]
+    assert reloaded.get_cached_classification(body, subject)["cache_type"] == "exact_match"
+
+
+@pytest.mark.skipif(cache_module.MinHashLSH is None, reason="datasketch not installed")
+def test_lsh_entries_removed_on_eviction(tmp_path, monkeypatch):
+    cache = _make_cache(tmp_path, monkeypatch, MAX_CACHE_SIZE=2)
+    for subject, body in EMAILS[:3]:
+        cache.cache_classification(body, subject, "Updates")
+    
+    evicted = cache._hash_processed(cache._preprocess_content(f"{EMAILS[0][0]} {EMAILS[0][1]}"))
+    kept = list(cache._cache_data["classifications"])
+    assert evicted not in cache._lsh
+    assert all(content_hash in cache._lsh for content_hash in kept)
+    assert cache._row_hashes == kept
+
+
+@pytest.mark.skipif(cache_module.MinHashLSH is None, reason="datasketch not installed")
+def test_lsh_entries_removed_on_ttl_expiry(tmp_path, monkeypatch):
+    cache = _make_cache(tmp_path, monkeypatch, CACHE_TTL=60)
+    for subject, body in EMAILS[:2]:
+        cache.cache_classification(body, subject, "Updates")
+    
+    # Age the oldest entry past its TTL
+    expired_hash, expired_entry = next(iter(cache._cache_data["classifications"].items()))
+    expired_entry["timestamp"] -= 120
+    
+    subject, body = EMAILS[0]
+    assert cache.get_cached_classification(body, subject) is None
+    assert expired_hash not in cache._cache_data["classifications"]
+    assert expired_hash not in cache._lsh
+    assert expired_hash not in cache._row_hashes
+
 if __name__ == "__main__":
     test_caching_functionality()
\ No newline at end of file
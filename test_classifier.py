@@ -0,0 +1,177 @@
+"""
+Tests for batched label parsing and call coalescing in llm_utils.classifier,
+run against a stubbed OpenAI client.
+"""
+
+import os
+import sys
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+import llm_utils.classifier as classifier
+from gmail_utils.ratelimit import SlidingWindowLimiter
+
+
+class StubCompletions:
+    """Answers each request with the next scripted reply (an exception is raised)."""
+
+    def __init__(self, replies):
+        self.replies = list(replies)
+        self.requests = []
+
+    def create(self, messages, model, temperature):
+        self.requests.append(messages)
+        reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=reply))])
+
+
+@pytest.fixture
+def completions(monkeypatch):
+    def install(*replies):
+        stub = StubCompletions(replies)
+        monkeypatch.setattr(classifier, "client", SimpleNamespace(chat=SimpleNamespace(completions=stub)))
+        return stub
+
+    monkeypatch.setattr(classifier, "_llm_rate_limiter", SlidingWindowLimiter(max_calls=1000, period=1))
+    monkeypatch.setattr(classifier, "CLASSIFICATION_BATCH_SIZE", 3)
+    # One worker, so scripted replies are consumed in chunk order
+    monkeypatch.setattr(classifier, "CLASSIFICATION_WORKERS", 1)
+    return install
+
+
+def label_in_batches(count, label_one=None):
+    subjects = [f"Subject {i}" for i in range(count)]
+    bodies = [f"Body {i}" for i in range(count)]
+    stored = {}
+    asked_alone = []
+
+    def one(index):
+        asked_alone.append(index)
+        return label_one(index) if label_one else "Spam"
+
+    labels = classifier._label_in_batches(
+        list(range(count)), subjects, bodies,
+        stored.__setitem__,
+        classifier.batch_categorization_messages, classifier._NUMBERED_CATEGORY_RE, classifier.CATEGORIES,
+        one, default="Updates", description="email categorizations",
+    )
+    return labels, stored, asked_alone
+
+
+def test_numbered_lines_are_parsed_case_insensitively(completions):
+    stub = completions("1: important\n2.  PROMOTIONS\nEmail 3 - Spam")
+
+    labels, stored, asked_alone = label_in_batches(3)
+
+    assert labels == {0: "Important", 1: "Promotions", 2: "Spam"}
+    assert stored == labels
+    assert asked_alone == []
+    assert len(stub.requests) == 1
+
+
+def test_emails_missing_from_the_answer_are_asked_alone(completions):
+    completions("1: Updates\n2: Urgent\n")
+
+    labels, stored, asked_alone = label_in_batches(3, label_one=lambda index: "Important")
+
+    # Line 2 names no valid label and line 3 is missing
+    assert labels == {0: "Updates", 1: "Important", 2: "Important"}
+    assert asked_alone == [1, 2]
+    assert stored == {0: "Updates"}
+
+
+def test_failed_batch_request_falls_back_to_default(completions):
+    completions(RuntimeError("API down"), "1: Spam\n2: Spam\n")
+
+    labels, stored, asked_alone = label_in_batches(5)
+
+    # First chunk failed, second chunk answered; nothing cached for the failure
+    assert labels == {0: "Updates", 1: "Updates", 2: "Updates", 3: "Spam", 4: "Spam"}
+    assert stored == {3: "Spam", 4: "Spam"}
+    assert asked_alone == []
+
+
+def test_single_email_chunk_is_asked_alone(completions):
+    stub = completions("1: Spam\n2: Spam\n3: Spam")
+
+    labels, _, asked_alone = label_in_batches(4)
+
+    assert asked_alone == [3]
+    assert labels[3] == "Spam"
+    assert len(stub.requests) == 1
+
+
+def test_coalesced_callers_share_one_result():
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        release.wait(5)
+        return "Promotions"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(classifier._coalesced(("test", "share"), call)))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert results == ["Promotions"] * 3
+    assert ("test", "share") not in classifier._inflight
+
+
+def test_coalesced_exception_reaches_every_caller():
+    release = threading.Event()
+    calls = []
+
+    def call():
+        calls.append(1)
+        release.wait(5)
+        raise ValueError("LLM failed")
+
+    errors = []
+
+    def run():
+        try:
+            classifier._coalesced(("test", "fail"), call)
+        except ValueError as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=run) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == [1]
+    assert errors == ["LLM failed"] * 3
+    assert ("test", "fail") not in classifier._inflight
+
+    # A later call runs again instead of reusing the failure
+    assert classifier._coalesced(("test", "fail"), lambda: "Spam") == "Spam"
+
+
+def test_reply_check_uses_keyword_rules_before_the_llm(completions):
+    stub = completions()
+
+    label = classifier.check_if_reply_needed("Your verification code", "Use 123456 to sign in")
+
+    assert label == "Unwanted Important"
+    assert stub.requests == []
@@ -0,0 +1,133 @@
+"""
+Tests for the batched message fetch in gmail_utils.fetch, run against a
+scripted fake batch service instead of the Gmail API.
+"""
+
+import os
+import sys
+
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import gmail_utils.fetch as fetch
+
+
+def http_error(status, retry_after=None):
+    headers = {"status": str(status)}
+    if retry_after is not None:
+        headers["retry-after"] = retry_after
+    return HttpError(httplib2.Response(headers), b"")
+
+
+class FakeGet:
+    def __init__(self, service, msg_id):
+        self.service = service
+        self.msg_id = msg_id
+
+    def execute(self):
+        self.service.singles.append(self.msg_id)
+        return {"id": self.msg_id}
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, request_id):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.service.sent.append([request_id for request_id, _ in self.requests])
+        outcome = self.service.script.pop(0) if self.service.script else {}
+        if isinstance(outcome, Exception):
+            raise outcome
+        for request_id, request in self.requests:
+            exception = outcome.get(request_id)
+            self.callback(request_id, None if exception else {"id": request.msg_id}, exception)
+
+
+class FakeService:
+    """
+    Each batch execute() takes the next script entry: an exception fails the
+    whole batch, a dict maps message IDs to the exception they fail with.
+    """
+
+    def __init__(self, script=()):
+        self.script = list(script)
+        self.sent = []
+        self.singles = []
+
+    def new_batch_http_request(self, callback):
+        return FakeBatch(self, callback)
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return self
+
+    def get(self, userId, id, **kwargs):
+        return FakeGet(self, id)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(fetch.time, "sleep", delays.append)
+    return delays
+
+
+def fetched_ids(service, message_ids):
+    return [message["id"] for message in fetch._batch_get_messages(service, message_ids)]
+
+
+def test_retryable_members_are_refetched(sleeps):
+    service = FakeService([{"b": http_error(429, retry_after="3"), "c": http_error(503)}, {}])
+
+    assert fetched_ids(service, ["a", "b", "c"]) == ["a", "b", "c"]
+    assert service.sent == [["a", "b", "c"], ["b", "c"]]
+    assert sleeps == [3.0]
+
+
+def test_members_failing_every_retry_are_skipped(sleeps):
+    service = FakeService([{"b": http_error(500)}] * (fetch.MAX_RETRIES + 1))
+
+    assert fetched_ids(service, ["a", "b"]) == ["a"]
+    assert len(service.sent) == fetch.MAX_RETRIES + 1
+
+
+def test_non_retryable_member_is_not_refetched(sleeps):
+    service = FakeService([{"b": http_error(404)}])
+
+    assert fetched_ids(service, ["a", "b"]) == ["a"]
+    assert service.sent == [["a", "b"]]
+    assert sleeps == []
+
+
+def test_member_401_is_raised(sleeps):
+    service = FakeService([{"b": http_error(401)}])
+
+    with pytest.raises(HttpError) as error:
+        fetch._batch_get_messages(service, ["a", "b"])
+    assert error.value.resp.status == 401
+
+
+def test_failed_batch_falls_back_to_single_requests(sleeps):
+    service = FakeService([http_error(500)])
+
+    assert fetched_ids(service, ["a", "b"]) == ["a", "b"]
+    assert service.singles == ["a", "b"]
+
+
+def test_batch_401_is_raised_instead_of_falling_back(sleeps):
+    service = FakeService([http_error(401)])
+
+    with pytest.raises(HttpError):
+        fetch._batch_get_messages(service, ["a", "b"])
+    assert service.singles == []
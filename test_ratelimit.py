@@ -0,0 +1,120 @@
+"""
+Tests for the Gmail quota token bucket and the sliding-window LLM limiter,
+run on a fake clock.
+"""
+
+import os
+import sys
+
+import pytest
+
+# Add the project root to Python path
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import gmail_utils.ratelimit as ratelimit
+from gmail_utils.ratelimit import SlidingWindowLimiter, TokenBucket
+
+
+class FakeClock:
+    """Stands in for the time module; sleep() advances monotonic() instantly."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(ratelimit, "time", fake)
+    return fake
+
+
+def test_acquire_within_capacity_does_not_wait(clock):
+    bucket = TokenBucket(capacity=10, refill_per_sec=5)
+
+    bucket.acquire(4)
+    bucket.acquire(6)
+
+    assert clock.sleeps == []
+
+
+def test_acquire_waits_for_refill(clock):
+    bucket = TokenBucket(capacity=10, refill_per_sec=5)
+    bucket.acquire(10)
+
+    bucket.acquire(5)
+
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+
+def test_cost_above_capacity_overdraws_once_full(clock):
+    bucket = TokenBucket(capacity=2, refill_per_sec=1)
+
+    # Let through right away because the bucket is full, leaving it 3 in debt
+    bucket.acquire(5)
+    assert clock.sleeps == []
+
+    # The next caller pays back the debt before its own token
+    bucket.acquire(1)
+    assert sum(clock.sleeps) == pytest.approx(4.0)
+
+
+def test_oversized_cost_waits_until_bucket_is_full(clock):
+    bucket = TokenBucket(capacity=2, refill_per_sec=1)
+    bucket.acquire(2)
+
+    bucket.acquire(5)
+
+    # Only needs a full bucket (2 tokens), not all 5
+    assert sum(clock.sleeps) == pytest.approx(2.0)
+
+
+def test_refill_is_capped_at_capacity(clock):
+    bucket = TokenBucket(capacity=3, refill_per_sec=1)
+    clock.now += 100
+
+    bucket.acquire(3)
+    bucket.acquire(1)
+
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+
+
+def test_window_lets_calls_through_together(clock):
+    limiter = SlidingWindowLimiter(max_calls=15, period=60)
+
+    for _ in range(15):
+        limiter.acquire()
+
+    assert clock.sleeps == []
+
+
+def test_window_waits_for_the_oldest_call_to_expire(clock):
+    limiter = SlidingWindowLimiter(max_calls=2, period=60)
+    limiter.acquire()
+    clock.now += 10
+    limiter.acquire()
+
+    limiter.acquire()
+
+    # The first call leaves the window 60 s after it was made
+    assert sum(clock.sleeps) == pytest.approx(50.0)
+    limiter.acquire()
+    assert sum(clock.sleeps) == pytest.approx(60.0)
+
+
+def test_window_cost_takes_several_slots(clock):
+    limiter = SlidingWindowLimiter(max_calls=3, period=60)
+
+    limiter.acquire(3)
+    assert clock.sleeps == []
+
+    limiter.acquire()
+    assert sum(clock.sleeps) == pytest.approx(60.0)
@@ -3,20 +3,31 @@ from gmail_utils.fetch import fetch_existing_emails
 from gmail_utils.actions import move_email, delete_email, batch_move_emails, batch_delete_emails
 # from llm_utils.classifier import classify_email, needs_response
 from llm_utils.summarizer import summarize_email
-from gmail_utils.retry import retry_on_api_error, safe_api_call
+from gmail_utils.retry import safe_api_call
 from gmail_utils.monitor import track_api_call, get_quota_monitor
-from config.settings import EMAIL_SETTINGS, GMAIL_LABELS, API_SETTINGS
+from config.settings import EMAIL_SETTINGS, GMAIL_LABELS
 from datetime import datetime, timedelta, timezone
-from pydantic import BaseModel
+from dataclasses import dataclass
 from typing import List, Optional, Dict
-from llm_utils.classifier import categorize_email, check_if_reply_needed
-import time
+from llm_utils.classifier import classify_emails, check_replies_needed, check_if_reply_needed
+from llm_utils.batch_classifier import submit_classification_batch, collect_classification_batch, has_pending_batch
+from llm_utils.cache import get_classification_cache
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
 import logging
 
 # Configure logging
 logger = logging.getLogger(__name__)
 
-class EmailState(BaseModel):
+# Labels being computed by a running classify step, keyed by email ID, so
+# graph invocations overlapping in this process classify each email once.
+# Separate processes do not see each other's entries.
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+# A plain dataclass, pydantic would re-validate every email dict at each graph step
+@dataclass(slots=True)
+class EmailState:
     emails: Optional[List[dict]] = None
     classified_emails: Optional[List[dict]] = None
     actions: Optional[List[dict]] = None
@@ -40,7 +51,7 @@ def process_existing_emails():
 def fetch_existing_emails_node(state: EmailState):
     """Fetch existing emails with caching and monitoring."""
     num_to_fetch = state.count if state.count is not None else EMAIL_SETTINGS["DEFAULT_EMAIL_COUNT"]
-    logger.info(f"Fetching {num_to_fetch} existing emails")
+    logger.info("Fetching %d existing emails", num_to_fetch)
     
     # Check if we should throttle based on quota usage
     quota_monitor = get_quota_monitor()
@@ -49,123 +60,218 @@ def fetch_existing_emails_node(state: EmailState):
         num_to_fetch = min(num_to_fetch, 3)  # Reduce batch size when throttling
     
     emails = fetch_existing_emails(num_to_fetch, use_cache=True)
-    logger.info(f"Fetched {len(emails)} existing emails")
+    logger.info("Fetched %d existing emails", len(emails))
     return {"emails": emails}
 
 @track_api_call("classify_emails_workflow", quota_cost=1)
 def classify_emails_node(state: EmailState):
-    """Classify emails with a two-step process."""
-    classified = []
+    """Classify emails into their final labels."""
     if not state.emails:
         logger.warning("No emails to classify")
         return {"classified_emails": []}
     
-    logger.info(f"Classifying {len(state.emails)} emails")
-    for email in state.emails:
-        time.sleep(API_SETTINGS["API_CALL_DELAY"] * 20)
-        
-        try:
-            # Step 1: Broad Categorization
-            category = categorize_email(email["subject"], email["body"])
-            final_label = category
+    if EMAIL_SETTINGS["USE_BATCH_LLM"]:
+        return classify_emails_batch(state.emails)
+    
+    logger.info("Classifying %d emails", len(state.emails))
+    
+    # Categorization and reply check in one step, several emails per LLM request
+    labels = _classify_single_flight(state.emails)
+    
+    classified = [{**email, "label": final_label} for email, final_label in zip(state.emails, labels)]
+    if logger.isEnabledFor(logging.DEBUG):
+        for email in classified:
+            logger.debug("Classified email %s as %s", email["id"], email["label"])
+            
+    logger.info("Successfully classified %d emails", len(classified))
+    return {"classified_emails": classified}
+
+def _classify_single_flight(emails):
+    """
+    Label emails with classify_emails, sharing labels with concurrent
+    invocations of the workflow in the same process.
+    
+    Emails that another invocation is already classifying wait for its
+    labels instead of being sent to the LLM a second time. Runs in other
+    processes only share results through the classification cache.
+    
+    Returns:
+        list: One final label per email, in input order
+    """
+    owned = {}
+    waiting = {}
+    to_classify = []
+    with _inflight_lock:
+        for email in emails:
+            email_id = email["id"]
+            if email_id in owned or email_id in waiting:
+                continue
+            future = _inflight.get(email_id)
+            if future is None:
+                owned[email_id] = _inflight[email_id] = Future()
+                to_classify.append(email)
+            else:
+                waiting[email_id] = future
+    
+    labels = {}
+    try:
+        if to_classify:
+            results = classify_emails(
+                [email["subject"] for email in to_classify],
+                [email["body"] for email in to_classify],
+            )
+            for email, label in zip(to_classify, results):
+                labels[email["id"]] = label
+                owned[email["id"]].set_result(label)
+    except Exception as e:
+        for future in owned.values():
+            if not future.done():
+                future.set_exception(e)
+        raise
+    finally:
+        with _inflight_lock:
+            for email_id in owned:
+                del _inflight[email_id]
+    
+    if waiting:
+        logger.info("Waiting on %d emails already being classified", len(waiting))
+        for email_id, future in waiting.items():
+            labels[email_id] = future.result()
+    
+    return [labels[email["id"]] for email in emails]
 
-            # Step 2: If it's important, check if a reply is needed
-            if category == "Important":
-                importance_label = check_if_reply_needed(email["subject"], email["body"])
-                final_label = importance_label
+def _label_replies(emails, categories):
+    """Replace each "Important" category with the result of a batched reply check."""
+    labels = list(categories)
+    important = [index for index, category in enumerate(categories) if category == "Important"]
+    if important:
+        reply_labels = check_replies_needed(
+            [emails[index]["subject"] for index in important],
+            [emails[index]["body"] for index in important],
+        )
+        for index, label in zip(important, reply_labels):
+            labels[index] = label
+    return labels
 
-            classified.append({**email, "label": final_label})
-            logger.debug(f"Classified email {email['id']} as {final_label}")
-        except Exception as e:
-            logger.error(f"Error classifying email {email['id']}: {e}")
+def classify_emails_batch(emails):
+    """
+    Classify emails through the OpenAI Batch API.
+    
+    Results of the batch submitted on a previous run are collected first.
+    Emails already in the classification cache are labelled right away and
+    the rest are submitted as a new batch, to be labelled on a later run.
+    """
+    classified = []
+    
+    # Step 1: Broad categorization, from the finished batch or the cache
+    categorized = collect_classification_batch()
+    done_ids = {email["id"] for email in categorized}
+    cache = get_classification_cache()
+    to_submit = []
+    for email in emails:
+        if email["id"] in done_ids:
             continue
-            
-    logger.info(f"Successfully classified {len(classified)} emails")
+        cached_result = cache.get_cached_classification(email["body"], email["subject"])
+        if cached_result:
+            categorized.append({**email, "category": cached_result["category"]})
+        else:
+            to_submit.append(email)
+    
+    # Step 2: If it's important, check if a reply is needed
+    categories = [email.pop("category") for email in categorized]
+    for email, final_label in zip(categorized, _label_replies(categorized, categories)):
+        classified.append({**email, "label": final_label})
+    
+    # Only one batch is kept in flight, the rest is picked up next run
+    if to_submit and not has_pending_batch():
+        submit_classification_batch(to_submit)
+        logger.info("Submitted %d emails for batch classification", len(to_submit))
+    
+    logger.info("Successfully classified %d emails", len(classified))
     return {"classified_emails": classified}
 
-@retry_on_api_error()
-@track_api_call("route_emails_workflow", quota_cost=2)
 def route_existing_action(state: EmailState):
-    """Route emails using batch operations for efficiency."""
+    """
+    Route emails using batch operations for efficiency.
+    
+    Retries and quota tracking happen per Gmail request inside the batch
+    helpers, so a failed move is not retried by redoing every other one.
+    """
     if not state.classified_emails:
         logger.warning("No classified emails to route")
         return {"actions": []}
         
     actions = []
-    now = datetime.now(timezone.utc)
-    
-    # Group emails by label for batch processing
-    emails_by_label: Dict[str, List[str]] = {
-        "wanted_important": [],
-        "unwanted_important": [],
-        "promotions": [],
-        "updates": [],
-        "spam": [],
-        "delete": []
+    # Promotions received before the cutoff are deleted, compared as epoch millis
+    cutoff_ms = int((datetime.now(timezone.utc) - timedelta(days=10)).timestamp() * 1000)
+    
+    # Message IDs to move or delete, one list per destination
+    wanted, unwanted, promos, updates, spam, to_delete = [], [], [], [], [], []
+    # One hashed lookup per email instead of a chain of label comparisons
+    buckets = {
+        "Wanted Important": wanted,
+        "Unwanted Important": unwanted,
+        "Promotions": promos,
+        "Updates": updates,
+        "Spam": spam,
     }
     
     # First pass: categorize emails
     for email in state.classified_emails:
         label = email["label"]
         email_id = email["id"]
-        
-        if "internalDate" in email:
-            received = datetime.fromtimestamp(int(email["internalDate"]) / 1000, tz=timezone.utc)
-        else:
-            received = now
+        bucket = buckets.get(label)
             
         # Use the new classification system
-        if label == "Wanted Important":
-            emails_by_label["wanted_important"].append(email_id)
-        elif label == "Unwanted Important":
-            emails_by_label["unwanted_important"].append(email_id)
-        elif label == "Promotions":
-            # Delete old promotions
-            if received < now - timedelta(days=10):
-                emails_by_label["delete"].append(email_id)
-                actions.append({"email_id": email_id, "action": "Deleted Promotion"})
+        if bucket is promos:
+            # Delete old promotions. The fetchers store internalDate as int
+            # milliseconds, 0 when Gmail gave none; unknown dates are kept.
+            received = email.get("internalDate") or cutoff_ms
+            if received < cutoff_ms:
+                to_delete.append(email_id)
+                actions.append({"email_id": email_id, "action": "Deleted Promotion", "label": label})
+                continue
             else:
-                emails_by_label["promotions"].append(email_id)
-        elif label == "Updates":
-            emails_by_label["updates"].append(email_id)
-        elif label == "Spam":
-            emails_by_label["spam"].append(email_id)
+                promos.append(email_id)
+        elif bucket is not None:
+            bucket.append(email_id)
         # Handle legacy classification
         elif label == "Important":
-            if needs_response(email["subject"], email["body"]):
-                emails_by_label["wanted_important"].append(email_id)
+            if check_if_reply_needed(email["subject"], email["body"]) == "Wanted Important":
+                wanted.append(email_id)
             else:
-                emails_by_label["unwanted_important"].append(email_id)
+                unwanted.append(email_id)
             
+        # One action per email, deleted promotions recorded theirs above
         actions.append({"email_id": email_id, "label": label})
     
     # Second pass: batch process emails by category
     logger.info("Processing emails in batches")
     
-    # Process each category with batch operations
-    if emails_by_label["wanted_important"]:
-        batch_move_emails(emails_by_label["wanted_important"], GMAIL_LABELS["WANTED_IMPORTANT"])
-        logger.info(f"Moved {len(emails_by_label['wanted_important'])} emails to Wanted Important")
-        
-    if emails_by_label["unwanted_important"]:
-        batch_move_emails(emails_by_label["unwanted_important"], GMAIL_LABELS["UNWANTED_IMPORTANT"])
-        logger.info(f"Moved {len(emails_by_label['unwanted_important'])} emails to Unwanted Important")
-        
-    if emails_by_label["promotions"]:
-        batch_move_emails(emails_by_label["promotions"], GMAIL_LABELS["PROMOTIONS"])
-        logger.info(f"Moved {len(emails_by_label['promotions'])} emails to Promotions")
-        
-    if emails_by_label["updates"]:
-        batch_move_emails(emails_by_label["updates"], GMAIL_LABELS["UPDATES"])
-        logger.info(f"Moved {len(emails_by_label['updates'])} emails to Updates")
-        
-    if emails_by_label["spam"]:
-        batch_move_emails(emails_by_label["spam"], GMAIL_LABELS["SPAM"])
-        logger.info(f"Moved {len(emails_by_label['spam'])} emails to Spam")
-        
-    if emails_by_label["delete"]:
-        batch_delete_emails(emails_by_label["delete"])
-        logger.info(f"Deleted {len(emails_by_label['delete'])} old promotional emails")
+    # Destinations are independent, so their batch calls overlap
+    moves = [
+        (wanted, GMAIL_LABELS["WANTED_IMPORTANT"], "Wanted Important"),
+        (unwanted, GMAIL_LABELS["UNWANTED_IMPORTANT"], "Unwanted Important"),
+        (promos, GMAIL_LABELS["PROMOTIONS"], "Promotions"),
+        (updates, GMAIL_LABELS["UPDATES"], "Updates"),
+        (spam, GMAIL_LABELS["SPAM"], "Spam"),
+    ]
+    moves = [move for move in moves if move[0]]
+    
+    if moves or to_delete:
+        with ThreadPoolExecutor(max_workers=len(moves) + 1) as executor:
+            futures = {
+                executor.submit(batch_move_emails, email_ids, label_id):
+                    ("Moved %d emails to %s", len(email_ids), name)
+                for email_ids, label_id, name in moves
+            }
+            if to_delete:
+                futures[executor.submit(batch_delete_emails, to_delete)] = \
+                    ("Deleted %d old promotional emails", len(to_delete))
+            
+            for future, message in futures.items():
+                future.result()
+                logger.info(*message)
     
-    logger.info(f"Completed processing {len(state.classified_emails)} emails")
+    logger.info("Completed processing %d emails", len(state.classified_emails))
     return {"actions": actions}
\ No newline at end of file
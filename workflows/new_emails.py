@@ -1,15 +1,21 @@
 from typing import List, Optional
 from langgraph.graph import StateGraph
-from gmail_utils.fetch import fetch_new_emails
+from gmail_utils.fetch import fetch_new_emails, commit_new_emails_checkpoint
 from gmail_utils.actions import move_email, save_draft, batch_move_emails
-from llm_utils.classifier import categorize_email, check_if_reply_needed
-from pydantic import BaseModel
-import time # Import the time module
+from llm_utils.classifier import classify_emails
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from config.settings import LLM_SETTINGS
 
-class EmailState(BaseModel):
+RESPONSE_WORKERS = LLM_SETTINGS["RESPONSE_WORKERS"]
+
+@dataclass(slots=True)
+class EmailState:
     emails: Optional[List[dict]] = None
     classified_emails: Optional[List[dict]] = None
     results: Optional[List[dict]] = None
+    # Set when some emails could not be labelled and were left for the next run
+    classification_failed: bool = False
 
 def process_new_emails():
     sg = StateGraph(EmailState)
@@ -30,25 +36,31 @@ def fetch_emails_node(state: EmailState):
 def classify_emails_node(state: EmailState):
     """Classify new emails to determine if a reply is needed."""
     classified = []
+    classification_failed = False
     if state.emails:
-        for email in state.emails:
-            time.sleep(5)
-            final_label = "Unwanted Important" # Default label
+        # Categorization and reply check in one step, several emails per
+        # LLM request; Important emails come back as Wanted or Unwanted Important.
+        # Emails the LLM failed to label come back as None
+        labels = classify_emails(
+            [email["subject"] for email in state.emails],
+            [email["body"] for email in state.emails],
+            default=None,
+        )
+
+        for email, final_label in zip(state.emails, labels):
             needs_reply = False
             
+            if final_label is None:
+                # Not routed, the next run fetches it again
+                print(f"Could not classify email {email['id']}, leaving it for the next run")
+                classification_failed = True
+                continue
+            
             try:
-                # Step 1: Broad categorization
-                category = categorize_email(email["subject"], email["body"])
-
-                # Step 2: If category is Important, check if a reply is needed
-                if category == "Important":
-                    final_label = check_if_reply_needed(email["subject"], email["body"])
-                else:
-                    final_label = category # It's Promotions, Updates, etc.
+                label = final_label.strip()
+                print(f"Subject: '{email['subject']}' ---> Classified as: '{label}'")
 
-                print(f"Subject: '{email['subject']}' ---> Classified as: '{final_label.strip()}'")
-
-                if final_label.strip().lower() == "wanted important":
+                if label.lower() == "wanted important":
                     needs_reply = True
                 
                 classified.append({
@@ -64,7 +76,7 @@ def classify_emails_node(state: EmailState):
                     "needs_reply": False
                 })
 
-    return {"classified_emails": classified}
+    return {"classified_emails": classified, "classification_failed": classification_failed}
 
 def route_action(state: EmailState):
     results = []
@@ -73,12 +85,23 @@ def route_action(state: EmailState):
     wanted_important_ids = []
     unwanted_important_ids = []
     
+    def draft_reply(email):
+        try:
+            draft_id = save_draft(email["subject"], email["body"], email["to_email"])
+            return {
+                "email_id": email["id"], 
+                "action": "Created draft reply",
+                "draft_id": draft_id
+            }
+        except Exception as e:
+            print(f"Error creating draft for {email['id']}: {e}")
+            return None
+    
+    drafts_failed = False
     if state.classified_emails:
+        to_draft = []
         for email in state.classified_emails:
             email_id = email["id"]
-            subject = email["subject"]
-            body = email["body"]
-            to_email = email["to_email"]
             label = email["label"]
             needs_reply = email.get("needs_reply", False)
             
@@ -88,15 +111,7 @@ def route_action(state: EmailState):
                 
                 # Only create draft replies for emails that need a response
                 if needs_reply:
-                    try:
-                        draft_id = save_draft(subject, body, to_email)
-                        results.append({
-                            "email_id": email_id, 
-                            "action": "Created draft reply",
-                            "draft_id": draft_id
-                        })
-                    except Exception as e:
-                        print(f"Error creating draft for {email_id}: {e}")
+                    to_draft.append(email)
             else:  # Unwanted Important
                 unwanted_important_ids.append(email_id)
                 results.append({
@@ -104,11 +119,25 @@ def route_action(state: EmailState):
                     "action": "Marked as important, no reply needed"
                 })
         
+        # Each draft waits on an LLM reply, so draft them concurrently
+        if to_draft:
+            with ThreadPoolExecutor(max_workers=min(RESPONSE_WORKERS, len(to_draft))) as executor:
+                drafted = list(executor.map(draft_reply, to_draft))
+            drafts_failed = None in drafted
+            results.extend(result for result in drafted if result)
+        
         # Batch move emails to appropriate labels
         if wanted_important_ids:
             batch_move_emails(wanted_important_ids, "IMPORTANT")
         
         if unwanted_important_ids:
             batch_move_emails(unwanted_important_ids, "IMPORTANT")
+    
+    # Emails are only marked as seen once every one was classified and
+    # every draft was saved, otherwise the next run fetches them again
+    if drafts_failed or state.classification_failed:
+        print("Some emails were not processed, new emails will be fetched again next run")
+    else:
+        commit_new_emails_checkpoint()
             
     return {"results": results}
\ No newline at end of file